@@ -0,0 +1,105 @@
+"""
+Caché LRU para Oaky Desktop
+Guarda en memoria las consultas más repetidas (por ejemplo, los escaneos)
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+
+
+class LRUCache:
+    """
+    Caché acotada que descarta primero lo usado hace más tiempo.
+
+    Es segura entre hilos y cuenta aciertos y fallos. Para no guardar un
+    valor leído antes de una invalidación (otro hilo pudo cambiarlo mientras
+    tanto), quien consulta la base toma version antes de leer y la pasa a
+    put; si hubo una invalidación en el medio, el valor se descarta.
+    """
+
+    def __init__(self, maxsize: int):
+        """
+        Args:
+            maxsize: Cantidad máxima de entradas
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Busca un valor y lo marca como usado recientemente
+
+        Returns:
+            El valor guardado o None si no está
+        """
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, version: int):
+        """
+        Guarda un valor, salvo que haya habido una invalidación desde que
+        se tomó version
+
+        Args:
+            key: Clave
+            value: Valor (no None)
+            version: Valor de self.version antes de leer el dato
+        """
+        with self._lock:
+            if version != self.version:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Hashable]):
+        """Descarta las claves indicadas"""
+        with self._lock:
+            self.version += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Any], bool]):
+        """Descarta las entradas cuyo valor cumple predicate"""
+        with self._lock:
+            self.version += 1
+            for key in [key for key, value in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def invalidate_all(self):
+        """Vacía la caché (los contadores se conservan)"""
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        """
+        Contadores de uso
+
+        Returns:
+            Diccionario con hits, misses, hit_rate, size y maxsize
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._data),
+                'maxsize': self.maxsize
+            }
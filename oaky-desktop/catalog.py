@@ -0,0 +1,236 @@
+"""
+Snapshot del catálogo en memoria para Oaky Desktop
+Columnas compactas (array) para filtrar y agregar sin consultar SQLite
+"""
+
+import sys
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from database import Database, DEFAULT_LOW_STOCK_THRESHOLD
+
+
+SNAPSHOT_COLUMNS = ('id', 'barcode', 'name', 'price', 'stock')
+
+
+class CatalogSnapshot:
+    """
+    Copia del catálogo guardada por columnas.
+
+    En lugar de un dict por producto se usan listas de strings internados
+    (códigos y nombres; los nombres se repiten mucho entre talles) y arrays
+    de tipo fijo para id, precio y stock. Los filtros y agregados recorren
+    estas columnas sin tocar la base de datos, y solo se arman diccionarios
+    para las filas que se van a mostrar.
+
+    Las bajas solo se marcan y las altas se agregan al final, fuera del
+    orden por nombre, hasta el próximo reload.
+    Los métodos de lectura se pueden usar desde otro hilo; reload y sync
+    leen con la conexión de lectura del hilo que los llama.
+    """
+
+    def __init__(self, db: Database):
+        """
+        Args:
+            db: Base de datos de origen
+        """
+        self.db = db
+        self._lock = threading.RLock()
+        self._synced_at = None
+        self._clear()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _clear(self):
+        """Vacía todas las columnas"""
+        self.ids = array('q')
+        self.barcodes: List[str] = []
+        self.names: List[str] = []
+        self.prices = array('d')
+        self.stocks = array('i')
+        self._keys: List[str] = []
+        self._alive = bytearray()
+        self._index: Dict[int, int] = {}
+
+    def reload(self):
+        """Carga el catálogo completo desde la base de datos"""
+        with self._lock:
+            self._clear()
+            self._synced_at = self.db.current_timestamp()
+            for rows in self.db.iter_products(columns=SNAPSHOT_COLUMNS):
+                for row in rows:
+                    self._append(*row)
+
+    def sync(self):
+        """
+        Incorpora los cambios hechos en la base desde la última carga
+        (por ejemplo una importación o un cambio masivo de precios)
+
+        Se releen solo las filas con updated_at posterior a la última
+        sincronización y se quitan las bajas que registró product_deletions.
+        Si la última sincronización es más vieja que ese registro, o la
+        cantidad de productos igual no coincide, se recarga todo.
+        """
+        if self._synced_at is None:
+            self.reload()
+            return
+
+        with self._lock:
+            now = self.db.current_timestamp()
+            deleted = self.db.get_deleted_product_ids(self._synced_at)
+            if deleted is None:
+                self.reload()
+                return
+
+            for product_id in deleted:
+                self._remove(product_id)
+            for rows in self.db.iter_products(columns=SNAPSHOT_COLUMNS,
+                                              changed_since=self._synced_at):
+                for row in rows:
+                    self._upsert(*row)
+
+            if len(self) != self.db.get_stats()['total_products']:
+                self.reload()
+                return
+
+            self._synced_at = now
+
+    def apply_delta(self, old: Optional[Dict], new: Optional[Dict]):
+        """
+        Aplica el cambio de un solo producto
+
+        Args:
+            old: Producto antes del cambio (None si es nuevo)
+            new: Producto después del cambio (None si se eliminó)
+        """
+        with self._lock:
+            if new is not None:
+                self._upsert(new['id'], new['barcode'], new['name'], new['price'], new['stock'])
+            elif old is not None:
+                self._remove(old['id'])
+
+    def search(self, search_term: str = "") -> List[int]:
+        """
+        Filtra por código de barras o nombre (subcadena, sin distinguir
+        mayúsculas)
+
+        Args:
+            search_term: Término de búsqueda
+
+        Returns:
+            Posiciones de los productos encontrados
+        """
+        key = search_term.strip().casefold()
+        with self._lock:
+            alive = self._alive
+            if not key:
+                return [pos for pos in range(len(alive)) if alive[pos]]
+            return [pos for pos, text in enumerate(self._keys) if key in text and alive[pos]]
+
+    def low_stock(self, threshold: int = DEFAULT_LOW_STOCK_THRESHOLD) -> List[int]:
+        """
+        Posiciones de los productos con stock menor al umbral
+
+        Args:
+            threshold: Umbral de stock bajo
+        """
+        with self._lock:
+            alive = self._alive
+            return [pos for pos, stock in enumerate(self.stocks) if stock < threshold and alive[pos]]
+
+    def rows(self, positions: Sequence[int], offset: int = 0,
+             limit: Optional[int] = None) -> List[Dict]:
+        """
+        Arma los diccionarios de una ventana de resultados
+
+        Args:
+            positions: Resultado de search o low_stock
+            offset: Primera posición a devolver
+            limit: Cantidad máxima (None = hasta el final)
+
+        Returns:
+            Lista de productos
+        """
+        end = len(positions) if limit is None else offset + limit
+        with self._lock:
+            return [
+                {
+                    'id': self.ids[pos],
+                    'barcode': self.barcodes[pos],
+                    'name': self.names[pos],
+                    'price': self.prices[pos],
+                    'stock': self.stocks[pos]
+                }
+                for pos in positions[offset:end]
+                if self._alive[pos]
+            ]
+
+    def stats(self, threshold: int = DEFAULT_LOW_STOCK_THRESHOLD,
+              positions: Optional[Sequence[int]] = None) -> Dict:
+        """
+        Estadísticas calculadas sobre las columnas en memoria
+
+        Args:
+            threshold: Umbral de stock bajo
+            positions: Limitar a estas posiciones (por defecto, todo)
+
+        Returns:
+            Diccionario con las mismas claves que Database.get_stats
+        """
+        with self._lock:
+            if positions is None:
+                positions = [pos for pos in range(len(self._alive)) if self._alive[pos]]
+
+            prices = self.prices
+            stocks = self.stocks
+            total_value = sum(prices[pos] * stocks[pos] for pos in positions)
+            total_stock = sum(stocks[pos] for pos in positions)
+            low_stock = sum(1 for pos in positions if stocks[pos] < threshold)
+
+        return {
+            'total_products': len(positions),
+            'total_value': round(total_value, 2),
+            'total_stock': total_stock,
+            'low_stock': low_stock
+        }
+
+    def _append(self, product_id: int, barcode: str, name: str, price: float, stock: int):
+        """Agrega un producto al final de las columnas"""
+        barcode = sys.intern(barcode)
+        name = sys.intern(name)
+
+        self._index[product_id] = len(self.ids)
+        self.ids.append(product_id)
+        self.barcodes.append(barcode)
+        self.names.append(name)
+        self.prices.append(price)
+        self.stocks.append(stock)
+        self._keys.append(sys.intern(f"{barcode}\x00{name}".casefold()))
+        self._alive.append(1)
+
+    def _upsert(self, product_id: int, barcode: str, name: str, price: float, stock: int):
+        """Actualiza un producto en su lugar o lo agrega si es nuevo"""
+        pos = self._index.get(product_id)
+        if pos is None:
+            self._append(product_id, barcode, name, price, stock)
+            return
+
+        barcode = sys.intern(barcode)
+        name = sys.intern(name)
+        self.barcodes[pos] = barcode
+        self.names[pos] = name
+        self.prices[pos] = price
+        self.stocks[pos] = stock
+        self._keys[pos] = sys.intern(f"{barcode}\x00{name}".casefold())
+
+    def _remove(self, product_id: int):
+        """
+        Marca un producto como eliminado. No se compactan las columnas para
+        que las posiciones ya entregadas por search sigan siendo válidas;
+        el espacio se recupera en el próximo reload.
+        """
+        pos = self._index.pop(product_id, None)
+        if pos is not None:
+            self._alive[pos] = 0
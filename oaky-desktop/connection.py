@@ -0,0 +1,237 @@
+"""
+Conexiones SQLite para Oaky Desktop
+Un escritor serializado y una conexión de lectura por hilo, en modo WAL
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+
+# Ajustes aplicados a cada conexión
+SYNCHRONOUS = 'NORMAL'               # con WAL es seguro ante cortes del programa
+MMAP_SIZE = 256 * 1024 * 1024        # lecturas vía memoria mapeada
+CACHE_SIZE_KB = 16 * 1024            # caché de páginas por conexión
+BUSY_TIMEOUT_S = 10.0                # espera ante bloqueos de otros procesos
+STATEMENT_CACHE_SIZE = 256           # sentencias preparadas por conexión
+
+
+class ConnectionManager:
+    """
+    Administra las conexiones a un archivo de base de datos.
+
+    - Activa WAL, así las lecturas no esperan a las escrituras.
+    - Cada hilo recibe su propia conexión de lectura (solo consulta).
+    - Hay un único escritor, compartido por todos los hilos del proceso y
+      protegido por un lock; las escrituras se confirman al salir del
+      bloque writer() más externo y los bloques anidados son savepoints.
+
+    Se comparte un administrador por archivo (ver shared) para que todas
+    las instancias de Database de un proceso usen el mismo escritor.
+    """
+
+    _shared: Dict[str, 'ConnectionManager'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: Ruta al archivo de base de datos (o ':memory:')
+        """
+        self.db_path = db_path
+        self.in_memory = db_path == ':memory:'
+        self._key = None
+        self._users = 0
+
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer_owner = None
+        self._after_write: List[Callable[[], None]] = []
+        self._writer = self._open(readonly=False)
+        self._data_version = None
+
+        # Database crea o verifica el esquema una sola vez por administrador
+        self.schema_ready = False
+        self.schema_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, db_path: str) -> 'ConnectionManager':
+        """
+        Obtiene el administrador del archivo, creándolo si hace falta.
+        Cada llamada debe tener su release correspondiente.
+
+        Args:
+            db_path: Ruta al archivo de base de datos
+        """
+        key = db_path if db_path == ':memory:' else os.path.abspath(db_path)
+
+        with cls._shared_lock:
+            manager = cls._shared.get(key)
+            # Cada ':memory:' es una base distinta: nunca se comparte
+            if manager is None or manager.in_memory:
+                manager = cls(db_path)
+                manager._key = key
+                if not manager.in_memory:
+                    cls._shared[key] = manager
+            manager._users += 1
+            return manager
+
+    def release(self):
+        """Libera un uso del administrador; con el último se cierra todo"""
+        with self._shared_lock:
+            self._users -= 1
+            if self._users > 0:
+                self.release_reader()
+                return
+            if self._shared.get(self._key) is self:
+                del self._shared[self._key]
+
+        self.close()
+
+    def _open(self, readonly: bool) -> sqlite3.Connection:
+        """Abre una conexión con los ajustes de rendimiento"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_S,
+            check_same_thread=False,
+            # Las sentencias se reutilizan por texto: las consultas frecuentes
+            # no se vuelven a compilar aunque haya lotes IN de tamaño variable
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row  # Para acceder a columnas por nombre
+
+        if not self.in_memory and not readonly:
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        """
+        Conexión de lectura del hilo actual
+
+        Si el hilo está dentro de una escritura se devuelve el escritor,
+        para que vea sus propios cambios todavía no confirmados.
+        """
+        if self.in_memory or self._writer_owner == threading.get_ident():
+            return self._writer
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open(readonly=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def release_reader(self):
+        """Cierra la conexión de lectura del hilo actual, si tiene una"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+
+        self._local.conn = None
+        with self._readers_lock:
+            if conn in self._readers:
+                self._readers.remove(conn)
+        conn.close()
+
+    @property
+    def in_write(self) -> bool:
+        """Indica si el hilo actual está dentro de un bloque writer()"""
+        return self._writer_owner == threading.get_ident()
+
+    def after_write(self, callback: Callable[[], None]):
+        """
+        Ejecuta callback cuando termine el bloque writer() más externo del
+        hilo actual (ya confirmado o revertido). Fuera de un bloque se
+        ejecuta en el momento.
+        """
+        if self.in_write:
+            self._after_write.append(callback)
+        else:
+            callback()
+
+    def external_change(self) -> bool:
+        """
+        Indica si otro proceso (la línea de comandos, el servidor) confirmó
+        cambios desde la última consulta
+
+        Se lee PRAGMA data_version en el escritor, que solo cambia con
+        commits de otras conexiones: todas las escrituras de este proceso
+        pasan por él, así que no cuentan. Si otro hilo está escribiendo no
+        se espera: mientras tenga la transacción abierta nadie más puede
+        confirmar, y el cambio se detecta en la consulta siguiente.
+        """
+        if self.in_memory or not self._write_lock.acquire(blocking=False):
+            return False
+        try:
+            version = self._writer.execute("PRAGMA data_version").fetchone()[0]
+            changed = self._data_version is not None and version != self._data_version
+            self._data_version = version
+            return changed
+        finally:
+            self._write_lock.release()
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Bloque de escritura serializado
+
+        El bloque más externo abre la transacción y la confirma al salir (o
+        la revierte si sale con una excepción). Los bloques anidados en el
+        mismo hilo son savepoints: si fallan se deshace solo su parte y la
+        transacción externa sigue abierta.
+        """
+        with self._write_lock:
+            self._write_depth += 1
+            self._writer_owner = threading.get_ident()
+            savepoint = f"sp{self._write_depth}" if self._write_depth > 1 else None
+            try:
+                if savepoint:
+                    self._writer.execute(f"SAVEPOINT {savepoint}")
+                elif not self._writer.in_transaction:
+                    # Tomar el lock de escritura de entrada evita quedar a
+                    # mitad de la transacción esperando a otro proceso
+                    self._writer.execute("BEGIN IMMEDIATE")
+                yield self._writer
+            except BaseException:
+                if savepoint:
+                    self._writer.execute(f"ROLLBACK TO {savepoint}")
+                    self._writer.execute(f"RELEASE {savepoint}")
+                else:
+                    self._writer.rollback()
+                raise
+            else:
+                if savepoint:
+                    self._writer.execute(f"RELEASE {savepoint}")
+                else:
+                    self._writer.commit()
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._writer_owner = None
+                    callbacks, self._after_write = self._after_write, []
+                    for callback in callbacks:
+                        callback()
+
+    def close(self):
+        """Cierra el escritor y todas las conexiones de lectura"""
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+
+        with self._write_lock:
+            self._writer.close()
@@ -5,13 +5,161 @@ Maneja todas las operaciones con SQLite
 
 import sqlite3
 import os
-from typing import List, Dict, Optional, Tuple
-from datetime import datetime
+import json
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Sequence, Set, Tuple
+from datetime import date, datetime
+
+from cache import LRUCache
+from connection import ConnectionManager
+from records import Record, record_type, to_records
+
+
+# Productos por lote (una transacción cada uno) al importar
+IMPORT_CHUNK_SIZE = 500
+
+# Parámetros por consulta (límite de SQLite en versiones anteriores a 3.32)
+MAX_SQL_PARAMS = 999
+
+# Filas por lote al recorrer la tabla con iter_products
+ITER_BATCH_SIZE = 1000
+
+# Columnas de products que se pueden pedir a iter_products
+PRODUCT_COLUMNS = ('id', 'barcode', 'name', 'price', 'stock', 'created_at', 'updated_at')
+
+# Productos guardados en memoria para búsquedas por código de barras
+BARCODE_CACHE_SIZE = 2048
+
+# Cambios masivos de precios que se conservan para poder deshacerlos
+PRICE_JOURNAL_BATCHES = 20
+
+# Motivos de los movimientos de stock
+STOCK_REASON_ADJUSTMENT = 'ajuste'   # stock fijado a mano (diálogo, update_product)
+STOCK_REASON_SALE = 'venta'
+STOCK_REASON_RESTOCK = 'reposicion'
+STOCK_REASON_NEW = 'alta'
+STOCK_REASON_DELETED = 'baja'
+STOCK_REASON_INITIAL = 'inicial'
+
+# Días que se conservan las bajas de productos (para sincronizar snapshots)
+DELETION_RETENTION_DAYS = 30
+
+# Versión del esquema (PRAGMA user_version). Subirla cuando _create_schema
+# cambie, así las bases existentes lo vuelven a aplicar una vez
+SCHEMA_VERSION = 3
+
+# Umbral de stock bajo por defecto (se guarda en la tabla settings)
+DEFAULT_LOW_STOCK_THRESHOLD = 5
+
+# Umbral de stock bajo configurado, para usar dentro de SQL y triggers
+LOW_STOCK_SQL = (
+    "(SELECT CAST(value AS INTEGER) FROM settings WHERE key = 'low_stock_threshold')"
+)
+
+
+def new_import_stats() -> Dict:
+    """
+    Crea las estadísticas vacías de una importación
+    
+    Returns:
+        Diccionario con estadísticas de importación
+    """
+    return {
+        'imported': 0,
+        'updated': 0,
+        'errors': [],
+        'total': 0,
+        'cancelled': False
+    }
+
+
+def validate_import_row(data: Dict) -> Tuple[Optional[Tuple[str, str, float, int]], Optional[str]]:
+    """
+    Valida y convierte una fila de importación
+    
+    Args:
+        data: Diccionario con barcode, name, price y stock (opcional)
+        
+    Returns:
+        Tupla (fila (barcode, name, price, stock) o None, mensaje de error o None)
+    """
+    try:
+        barcode = data.get('barcode', '').strip()
+        name = data.get('name', '').strip()
+        price = float(data.get('price', 0))
+        stock = int(data.get('stock', 0))
+    except Exception as e:
+        return None, f"Error en {data.get('barcode', 'desconocido')}: {str(e)}"
+    
+    if not barcode or not name or price <= 0:
+        return None, f"Datos inválidos: {barcode}"
+    
+    return (barcode, name, price, stock), None
+
+
+def validate_update_row(data: Dict) -> Tuple[Optional[Tuple], Optional[str]]:
+    """
+    Valida y convierte un cambio para update_products
+    
+    Args:
+        data: Diccionario con barcode y los campos a cambiar (name, price
+            y/o stock); los que falten conservan su valor
+        
+    Returns:
+        Tupla (fila (name, price, stock, barcode) con None en los campos que no
+        cambian, o None; mensaje de error o None)
+    """
+    barcode = str(data.get('barcode') or '').strip()
+    try:
+        name = data['name'].strip() if data.get('name') is not None else None
+        price = float(data['price']) if data.get('price') is not None else None
+        stock = int(data['stock']) if data.get('stock') is not None else None
+    except Exception as e:
+        return None, f"Error en {barcode or 'desconocido'}: {str(e)}"
+    
+    if not barcode or name == '' or (price is not None and price <= 0):
+        return None, f"Datos inválidos: {barcode}"
+    if stock is not None and stock < 0:
+        return None, f"El stock no puede ser negativo: {barcode}"
+    
+    return (name, price, stock, barcode), None
+
+
+class _BatchRejected(Exception):
+    """Interrumpe (y revierte) un lote con all_or_nothing"""
+
+
+def _history_time(when, end_of_day: bool = False) -> str:
+    """
+    Convierte una fecha al formato de changed_at ('YYYY-MM-DD HH:MM:SS')
+    
+    Args:
+        when: date, datetime o texto 'YYYY-MM-DD' / 'YYYY-MM-DD HH:MM:SS'
+        end_of_day: Si solo hay fecha, tomar el último segundo del día
+        
+    Returns:
+        Fecha y hora comparables con changed_at
+    """
+    if isinstance(when, datetime):
+        return when.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(when, date):
+        when = when.isoformat()
+    when = str(when).strip()
+    if len(when) == 10:
+        return f"{when} 23:59:59" if end_of_day else f"{when} 00:00:00"
+    return when
 
 
 class Database:
     """Clase para manejar la base de datos de productos"""
     
+    # Una caché de códigos de barras por archivo, compartida por todas las
+    # instancias (y hilos) que usan el mismo administrador de conexiones
+    _barcode_caches = weakref.WeakKeyDictionary()
+    _barcode_caches_lock = threading.Lock()
+    
     def __init__(self, db_path: str = "oaky.db"):
         """
         Inicializa la conexión a la base de datos
@@ -20,20 +168,154 @@ class Database:
             db_path: Ruta al archivo de base de datos
         """
         self.db_path = db_path
-        self.conn = None
-        self.cursor = None
+        self.connections = None
+        self.barcode_cache = None
+        self.fts_enabled = False
         self._connect()
         self._create_tables()
     
     def _connect(self):
-        """Establece la conexión a la base de datos"""
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row  # Para acceder a columnas por nombre
-        self.cursor = self.conn.cursor()
+        """
+        Obtiene el administrador de conexiones del archivo (WAL, una
+        conexión de lectura por hilo y un escritor compartido)
+        """
+        self.connections = ConnectionManager.shared(self.db_path)
+        
+        with self._barcode_caches_lock:
+            cache = self._barcode_caches.get(self.connections)
+            if cache is None:
+                cache = LRUCache(BARCODE_CACHE_SIZE)
+                self._barcode_caches[self.connections] = cache
+        self.barcode_cache = cache
+    
+    def _read(self) -> sqlite3.Cursor:
+        """Cursor sobre la conexión de lectura del hilo actual"""
+        return self.connections.reader().cursor()
+    
+    def _fetch_records(self, sql: str, params=()) -> List[Record]:
+        """
+        Ejecuta una consulta de lectura y devuelve sus filas como registros
+        
+        Args:
+            sql: Consulta (el texto fijo aprovecha la caché de sentencias)
+            params: Parámetros de la consulta
+            
+        Returns:
+            Lista de registros
+        """
+        cursor = self._read()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        return to_records(cursor.description, cursor.fetchall())
+    
+    def _fetch_record(self, sql: str, params=()) -> Optional[Record]:
+        """Como _fetch_records, para consultas de una sola fila"""
+        cursor = self._read()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return record_type(tuple(column[0] for column in cursor.description))(row)
+    
+    def _invalidate_cache(self, barcodes: Iterable[str] = (),
+                          product_ids: Optional[Iterable[int]] = None,
+                          everything: bool = False):
+        """
+        Saca de la caché de códigos de barras los productos modificados
+        
+        Se descartan ahora y otra vez al terminar la transacción: así no
+        queda en caché un valor leído por otro hilo antes del commit ni uno
+        sin confirmar que después se revierta.
+        
+        Args:
+            barcodes: Códigos de barras modificados
+            product_ids: IDs de productos modificados
+            everything: Vaciar toda la caché
+        """
+        cache = self.barcode_cache
+        barcodes = set(barcodes)
+        product_ids = set(product_ids or ())
+        
+        def evict():
+            if everything:
+                cache.invalidate_all()
+                return
+            if barcodes:
+                cache.invalidate(barcodes)
+            if product_ids:
+                cache.invalidate_where(lambda product: product['id'] in product_ids)
+        
+        evict()
+        self.connections.after_write(evict)
+    
+    def barcode_cache_stats(self) -> Dict:
+        """
+        Contadores de la caché de búsquedas por código de barras
+        
+        Returns:
+            Diccionario con hits, misses, hit_rate, size y maxsize
+        """
+        return self.barcode_cache.stats()
+    
+    @contextmanager
+    def _write(self):
+        """
+        Cursor sobre el escritor compartido. Al salir del bloque se confirma
+        la transacción (o se revierte si hubo una excepción); dentro de
+        transaction() el bloque es un savepoint y no confirma.
+        """
+        with self.connections.writer() as conn:
+            yield conn.cursor()
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Agrupa varias operaciones en una sola transacción
+        
+        Dentro del bloque create_product, update_product, delete_product,
+        update_prices_bulk, las importaciones, etc. no confirman por su
+        cuenta: todo se confirma una vez al salir (o se revierte si sale una
+        excepción). Los bloques se pueden anidar; cada uno es un savepoint.
+        Mientras el bloque está abierto las escrituras de otros hilos esperan.
+        
+        Ejemplo:
+            with db.transaction():
+                for barcode, name, price, stock in restock:
+                    db.update_product(barcode, name, price, stock)
+        """
+        with self.connections.writer():
+            yield self
     
     def _create_tables(self):
-        """Crea las tablas necesarias si no existen"""
-        self.cursor.execute("""
+        """
+        Crea las tablas necesarias si no existen
+        
+        Se hace una vez por archivo en cada proceso. Si la base ya tiene el
+        esquema actual (PRAGMA user_version) solo se lee: abrir otra
+        instancia de Database nunca espera a una escritura en curso.
+        """
+        manager = self.connections
+        if not manager.schema_ready:
+            with manager.schema_lock:
+                if not manager.schema_ready:
+                    cursor = self._read()
+                    cursor.execute("PRAGMA user_version")
+                    if cursor.fetchone()[0] < SCHEMA_VERSION:
+                        with self._write() as cursor:
+                            self._create_schema(cursor)
+                            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                    manager.schema_ready = True
+        
+        cursor = self._read()
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )
+        self.fts_enabled = cursor.fetchone() is not None
+    
+    def _create_schema(self, cursor: sqlite3.Cursor):
+        """Crea tablas, índices y triggers con el cursor del escritor"""
+        cursor.execute("""
             CREATE TABLE IF NOT EXISTS products (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 barcode TEXT UNIQUE NOT NULL,
@@ -46,50 +328,479 @@ class Database:
         """)
         
         # Crear índices para mejorar búsquedas
-        self.cursor.execute("""
+        cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_barcode ON products(barcode)
         """)
-        self.cursor.execute("""
+        cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_name ON products(name)
         """)
+        # Índice cubriente para el reporte de stock bajo (stock < umbral)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stock ON products(stock, name, barcode, price)
+        """)
+        
+        # Configuración
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            INSERT OR IGNORE INTO settings (key, value) VALUES ('low_stock_threshold', ?)
+        """, (str(DEFAULT_LOW_STOCK_THRESHOLD),))
+        
+        self._create_search_index(cursor)
+        self._create_stats_table(cursor)
+        self._create_price_journal(cursor)
+        self._create_price_history(cursor)
+        self._create_stock_ledger(cursor)
+        self._create_deletion_log(cursor)
+    
+    def _create_deletion_log(self, cursor: sqlite3.Cursor):
+        """
+        Crea el registro de bajas de productos, que completa un trigger con
+        cada DELETE (por cualquier camino). Así una copia en memoria puede
+        sincronizarse sin recargar todo aunque haya bajas y altas a la vez.
+        Solo se guardan los últimos DELETION_RETENTION_DAYS días.
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS product_deletions (
+                product_id INTEGER NOT NULL,
+                deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_product_deletions_at
+            ON product_deletions(deleted_at)
+        """)
+        
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS product_deletions_ad AFTER DELETE ON products BEGIN
+                INSERT INTO product_deletions (product_id) VALUES (old.id);
+                DELETE FROM product_deletions
+                WHERE deleted_at < datetime('now', '-{DELETION_RETENTION_DAYS} days');
+            END
+        """)
+    
+    def _create_stock_ledger(self, cursor: sqlite3.Cursor):
+        """
+        Crea el registro de movimientos de stock y los triggers que lo
+        completan con cada cambio de products.stock (por cualquier camino),
+        de modo que la suma de los movimientos de un producto siempre es
+        igual a su stock
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock_movements'"
+        )
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                stock_after INTEGER NOT NULL,
+                reason TEXT NOT NULL DEFAULT '{STOCK_REASON_ADJUSTMENT}',
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stock_movements_product
+            ON stock_movements(product_id, created_at)
+        """)
+        
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS stock_movements_ai AFTER INSERT ON products
+            WHEN new.stock != 0 BEGIN
+                INSERT INTO stock_movements (product_id, delta, stock_after, reason)
+                VALUES (new.id, new.stock, new.stock, '{STOCK_REASON_NEW}');
+            END
+        """)
+        # Motivo de los movimientos en curso: adjust_stock_batch lo fija antes
+        # de sus UPDATE y lo borra al terminar, dentro de la misma transacción
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stock_context (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                reason TEXT NOT NULL
+            )
+        """)
+        
+        # Se recrea por si la base tiene la versión anterior (sin stock_context)
+        cursor.execute("DROP TRIGGER IF EXISTS stock_movements_au")
+        cursor.execute(f"""
+            CREATE TRIGGER stock_movements_au AFTER UPDATE OF stock ON products
+            WHEN old.stock IS NOT new.stock BEGIN
+                INSERT INTO stock_movements (product_id, delta, stock_after, reason)
+                VALUES (
+                    new.id, new.stock - old.stock, new.stock,
+                    COALESCE(
+                        (SELECT reason FROM stock_context WHERE id = 1),
+                        '{STOCK_REASON_ADJUSTMENT}'
+                    )
+                );
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS stock_movements_ad AFTER DELETE ON products
+            WHEN old.stock != 0 BEGIN
+                INSERT INTO stock_movements (product_id, delta, stock_after, reason)
+                VALUES (old.id, -old.stock, 0, '{STOCK_REASON_DELETED}');
+            END
+        """)
+        
+        if not exists:
+            # Base existente: el stock actual es el saldo inicial
+            cursor.execute(f"""
+                INSERT INTO stock_movements (product_id, delta, stock_after, reason)
+                SELECT id, stock, stock, '{STOCK_REASON_INITIAL}' FROM products WHERE stock != 0
+            """)
+    
+    def _create_price_history(self, cursor: sqlite3.Cursor):
+        """
+        Crea el historial de precios (solo se agregan filas) y los triggers
+        que lo completan en la misma transacción que cada alta o cambio de
+        precio, venga de la GUI, una importación o un cambio masivo
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_history'"
+        )
+        exists = cursor.fetchone() is not None
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS price_history (
+                id INTEGER PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                old_price REAL,
+                new_price REAL NOT NULL,
+                changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Las filas de un producto quedan contiguas y ordenadas por fecha
+        # (más el id implícito): "precio al día X" es una sola búsqueda
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_price_history_product
+            ON price_history(product_id, changed_at)
+        """)
+        # Ventanas de tiempo sobre todo el catálogo ("últimos 90 días"),
+        # cubriente para agrupar por producto sin leer la tabla
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_price_history_changed
+            ON price_history(changed_at, product_id)
+        """)
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS price_history_ai AFTER INSERT ON products BEGIN
+                INSERT INTO price_history (product_id, old_price, new_price)
+                VALUES (new.id, NULL, new.price);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS price_history_au AFTER UPDATE OF price ON products
+            WHEN old.price IS NOT new.price BEGIN
+                INSERT INTO price_history (product_id, old_price, new_price)
+                VALUES (new.id, old.price, new.price);
+            END
+        """)
+        
+        if not exists:
+            # Base existente: el precio actual es el primero conocido
+            cursor.execute("""
+                INSERT INTO price_history (product_id, old_price, new_price, changed_at)
+                SELECT id, NULL, price, COALESCE(updated_at, CURRENT_TIMESTAMP) FROM products
+            """)
+    
+    def _create_price_journal(self, cursor: sqlite3.Cursor):
+        """
+        Crea el registro de cambios masivos de precios: una fila por cambio
+        y el precio anterior de cada producto que modificó
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS price_batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                percentage REAL NOT NULL,
+                description TEXT NOT NULL,
+                product_count INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reverted_at TIMESTAMP
+            )
+        """)
+        # Sin rowid: la clave primaria es el propio orden de la tabla
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS price_batch_items (
+                batch_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                old_price REAL NOT NULL,
+                PRIMARY KEY (batch_id, product_id)
+            ) WITHOUT ROWID
+        """)
+    
+    def _create_stats_table(self, cursor: sqlite3.Cursor):
+        """
+        Crea la tabla de estadísticas (una sola fila) y los triggers que la
+        actualizan en cada alta, baja o cambio de precio/stock
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS product_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_products INTEGER NOT NULL,
+                total_value REAL NOT NULL,
+                total_stock INTEGER NOT NULL,
+                low_stock INTEGER NOT NULL
+            )
+        """)
+        
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS product_stats_ai AFTER INSERT ON products BEGIN
+                UPDATE product_stats SET
+                    total_products = total_products + 1,
+                    total_value = total_value + new.price * new.stock,
+                    total_stock = total_stock + new.stock,
+                    low_stock = low_stock + (new.stock < {LOW_STOCK_SQL})
+                WHERE id = 1;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS product_stats_ad AFTER DELETE ON products BEGIN
+                UPDATE product_stats SET
+                    total_products = total_products - 1,
+                    total_value = total_value - old.price * old.stock,
+                    total_stock = total_stock - old.stock,
+                    low_stock = low_stock - (old.stock < {LOW_STOCK_SQL})
+                WHERE id = 1;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS product_stats_au AFTER UPDATE OF price, stock ON products
+            WHEN old.price IS NOT new.price OR old.stock IS NOT new.stock BEGIN
+                UPDATE product_stats SET
+                    total_value = total_value + new.price * new.stock - old.price * old.stock,
+                    total_stock = total_stock + new.stock - old.stock,
+                    low_stock = low_stock + (new.stock < {LOW_STOCK_SQL})
+                        - (old.stock < {LOW_STOCK_SQL})
+                WHERE id = 1;
+            END
+        """)
+        
+        cursor.execute("SELECT 1 FROM product_stats WHERE id = 1")
+        if cursor.fetchone() is None:
+            # Tabla nueva: calcular los valores iniciales
+            self.refresh_stats()
+    
+    def _create_search_index(self, cursor: sqlite3.Cursor):
+        """
+        Crea el índice de texto completo (FTS5 con tokenizer trigram) sobre
+        código de barras y nombre, sincronizado con triggers.
+        
+        Si SQLite no tiene FTS5 se sigue buscando con LIKE.
+        """
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )
+        exists = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    barcode, name,
+                    content='products', content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError:
+            return
+        
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts(rowid, barcode, name)
+                VALUES (new.id, new.barcode, new.name);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, barcode, name)
+                VALUES ('delete', old.id, old.barcode, old.name);
+            END
+        """)
+        # Solo cambios de código o nombre tocan el índice (no precio/stock)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF barcode, name ON products
+            WHEN old.barcode IS NOT new.barcode OR old.name IS NOT new.name BEGIN
+                INSERT INTO products_fts(products_fts, rowid, barcode, name)
+                VALUES ('delete', old.id, old.barcode, old.name);
+                INSERT INTO products_fts(rowid, barcode, name)
+                VALUES (new.id, new.barcode, new.name);
+            END
+        """)
+        
+        if not exists:
+            # Base existente creada antes del índice: indexar filas actuales
+            cursor.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    
+    def _search_clause(self, search_term: str) -> Tuple[str, str, Dict]:
+        """
+        Arma las cláusulas FROM/WHERE y ORDER BY de una búsqueda
+        
+        Args:
+            search_term: Término de búsqueda
+            
+        Returns:
+            Tupla (FROM ... WHERE, ORDER BY, parámetros)
+        """
+        term = search_term.strip()
+        
+        if not term:
+            # Si no hay término de búsqueda, devolver todos
+            return "FROM products p", "p.name, p.id", {}
         
-        self.conn.commit()
+        if self.fts_enabled and len(term) >= 3:
+            # Índice trigram: coincidencia por subcadena sin escanear la tabla.
+            # Orden: código exacto, prefijo de código, prefijo de nombre, relevancia
+            return (
+                """FROM products_fts f
+                JOIN products p ON p.id = f.rowid
+                WHERE products_fts MATCH :query""",
+                """CASE
+                    WHEN p.barcode = :term THEN 0
+                    WHEN instr(p.barcode, :term) = 1 THEN 1
+                    WHEN instr(LOWER(p.name), LOWER(:term)) = 1 THEN 2
+                    ELSE 3
+                END, f.rank, p.name, p.id""",
+                {'query': '"' + term.replace('"', '""') + '"', 'term': term}
+            )
+        
+        return (
+            "FROM products p WHERE p.barcode LIKE :like OR LOWER(p.name) LIKE LOWER(:like)",
+            "p.name, p.id",
+            {'like': f"%{search_term}%"}
+        )
     
-    def search_products(self, search_term: str = "") -> List[Dict]:
+    def search_products(self, search_term: str = "", limit: Optional[int] = None,
+                        offset: int = 0) -> List[Record]:
         """
         Busca productos por código de barras o nombre
         
         Args:
             search_term: Término de búsqueda
+            limit: Cantidad máxima de resultados (None = todos)
+            offset: Cantidad de resultados a saltear (paginado)
             
         Returns:
             Lista de productos encontrados
         """
-        if not search_term.strip():
-            # Si no hay término de búsqueda, devolver todos
-            self.cursor.execute("""
-                SELECT * FROM products ORDER BY name
-            """)
-        else:
-            self.cursor.execute("""
-                SELECT * FROM products 
-                WHERE barcode LIKE ? OR LOWER(name) LIKE LOWER(?)
-                ORDER BY name
-            """, (f"%{search_term}%", f"%{search_term}%"))
+        from_where, order_by, params = self._search_clause(search_term)
+        sql = f"SELECT p.* {from_where} ORDER BY {order_by}"
+        
+        if limit is not None:
+            sql += " LIMIT :limit OFFSET :offset"
+            params.update(limit=limit, offset=offset)
+        
+        return self._fetch_records(sql, params)
+    
+    def count_products(self, search_term: str = "") -> int:
+        """
+        Cuenta los productos que coinciden con una búsqueda
         
-        return [dict(row) for row in self.cursor.fetchall()]
+        Args:
+            search_term: Término de búsqueda
+            
+        Returns:
+            Cantidad de productos encontrados
+        """
+        from_where, _order_by, params = self._search_clause(search_term)
+        cursor = self._read()
+        cursor.execute(f"SELECT COUNT(*) {from_where}", params)
+        return cursor.fetchone()[0]
     
-    def get_all_products(self) -> List[Dict]:
+    def get_all_products(self) -> List[Record]:
         """
         Obtiene todos los productos
         
         Returns:
             Lista de todos los productos
         """
-        self.cursor.execute("SELECT * FROM products ORDER BY name")
-        return [dict(row) for row in self.cursor.fetchall()]
+        return self._fetch_records("SELECT * FROM products ORDER BY name")
+    
+    def iter_products(self, batch_size: int = ITER_BATCH_SIZE,
+                      columns: Sequence[str] = ('barcode', 'name', 'price', 'stock'),
+                      changed_since: Optional[str] = None) -> Iterator[List[tuple]]:
+        """
+        Recorre todos los productos por lotes con fetchmany, sin armar la
+        lista completa en memoria
+        
+        Usa un cursor propio, así que se pueden hacer otras consultas entre
+        lote y lote.
+        
+        Args:
+            batch_size: Cantidad de filas por lote
+            columns: Columnas a devolver (de PRODUCT_COLUMNS), en ese orden
+            changed_since: Solo productos con updated_at igual o posterior
+                (ver current_timestamp)
+            
+        Yields:
+            Listas de tuplas con los valores de las columnas pedidas
+        """
+        invalid = [column for column in columns if column not in PRODUCT_COLUMNS]
+        if invalid:
+            raise ValueError(f"Columnas inválidas: {', '.join(invalid)}")
+        
+        sql = f"SELECT {', '.join(columns)} FROM products"
+        params = []
+        if changed_since is not None:
+            sql += " WHERE updated_at >= ?"
+            params.append(changed_since)
+        
+        cursor = self._read()
+        try:
+            cursor.execute(sql + " ORDER BY name, id", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+        finally:
+            cursor.close()
     
-    def get_product_by_id(self, product_id: int) -> Optional[Dict]:
+    def current_timestamp(self, days_ago: int = 0) -> str:
+        """
+        Hora actual según SQLite, en el mismo formato que updated_at
+        
+        Args:
+            days_ago: Restar esta cantidad de días (ej. el inicio de un
+                período para get_price_at)
+            
+        Returns:
+            Fecha y hora 'YYYY-MM-DD HH:MM:SS' (UTC)
+        """
+        cursor = self._read()
+        cursor.execute("SELECT datetime('now', ?)", (f"-{int(days_ago)} days",))
+        return cursor.fetchone()[0]
+    
+    def get_deleted_product_ids(self, since: str) -> Optional[List[int]]:
+        """
+        IDs de los productos eliminados desde un momento dado
+        
+        Args:
+            since: Fecha y hora (ver current_timestamp); se incluyen las
+                bajas de ese mismo segundo
+            
+        Returns:
+            Lista de IDs, o None si since es anterior a lo que conserva el
+            registro de bajas (DELETION_RETENTION_DAYS)
+        """
+        cursor = self._read()
+        cursor.execute(
+            f"SELECT ? < datetime('now', '-{DELETION_RETENTION_DAYS} days')", (since,)
+        )
+        if cursor.fetchone()[0]:
+            return None
+        
+        cursor.execute(
+            "SELECT DISTINCT product_id FROM product_deletions WHERE deleted_at >= ?", (since,)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    
+    def get_product_by_id(self, product_id: int) -> Optional[Record]:
         """
         Obtiene un producto por su ID
         
@@ -97,13 +808,11 @@ class Database:
             product_id: ID del producto
             
         Returns:
-            Diccionario con datos del producto o None
+            Registro con datos del producto (acceso por nombre) o None
         """
-        self.cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-        row = self.cursor.fetchone()
-        return dict(row) if row else None
+        return self._fetch_record("SELECT * FROM products WHERE id = ?", (product_id,))
     
-    def get_product_by_barcode(self, barcode: str) -> Optional[Dict]:
+    def get_product_by_barcode(self, barcode: str) -> Optional[Record]:
         """
         Obtiene un producto por su código de barras
         
@@ -111,11 +820,34 @@ class Database:
             barcode: Código de barras
             
         Returns:
-            Diccionario con datos del producto o None
+            Registro con datos del producto (acceso por nombre) o None
         """
-        self.cursor.execute("SELECT * FROM products WHERE barcode = ?", (barcode,))
-        row = self.cursor.fetchone()
-        return dict(row) if row else None
+        # Lo que otro proceso escribió no pasa por _invalidate_cache
+        if self.connections.external_change():
+            self.barcode_cache.invalidate_all()
+        
+        # Los registros son inmutables: se pueden compartir desde la caché
+        product = self.barcode_cache.get(barcode)
+        if product is not None:
+            return product
+        
+        version = self.barcode_cache.version
+        product = self._fetch_record("SELECT * FROM products WHERE barcode = ?", (barcode,))
+        if product is not None:
+            self.barcode_cache.put(barcode, product, version)
+        return product
+    
+    def get_products_by_barcodes(self, barcodes: Iterable[str]) -> Dict[str, Record]:
+        """
+        Obtiene varios productos por código de barras
+        
+        Args:
+            barcodes: Códigos de barras
+            
+        Returns:
+            Diccionario código -> producto (sin los códigos inexistentes)
+        """
+        return {row['barcode']: row for row in self._select_by_barcodes("*", barcodes)}
     
     def create_product(self, barcode: str, name: str, price: float, stock: int = 0) -> Tuple[bool, str, int]:
         """
@@ -131,12 +863,12 @@ class Database:
             Tupla (éxito, mensaje, id del producto)
         """
         try:
-            self.cursor.execute("""
-                INSERT INTO products (barcode, name, price, stock)
-                VALUES (?, ?, ?, ?)
-            """, (barcode, name, price, stock))
-            self.conn.commit()
-            return True, "Producto creado exitosamente", self.cursor.lastrowid
+            with self._write() as cursor:
+                cursor.execute("""
+                    INSERT INTO products (barcode, name, price, stock)
+                    VALUES (?, ?, ?, ?)
+                """, (barcode, name, price, stock))
+            return True, "Producto creado exitosamente", cursor.lastrowid
         except sqlite3.IntegrityError:
             return False, "Ya existe un producto con ese código de barras", -1
         except Exception as e:
@@ -150,7 +882,7 @@ class Database:
         success, _msg, _id = self.create_product(barcode, name, price, stock)
         return success
 
-    def get_product(self, barcode: str) -> Optional[Dict]:
+    def get_product(self, barcode: str) -> Optional[Record]:
         """
         Wrapper para obtener producto por código de barras (compatibilidad con main.py).
         """
@@ -172,24 +904,26 @@ class Database:
             # Caso: llamada con product_id primero
             if len(args) == 5 and isinstance(args[0], int):
                 product_id, barcode, name, price, stock = args
-                self.cursor.execute("""
-                    UPDATE products 
-                    SET barcode = ?, name = ?, price = ?, stock = ?, 
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (barcode, name, price, stock, product_id))
-                self.conn.commit()
+                with self._write() as cursor:
+                    cursor.execute("""
+                        UPDATE products 
+                        SET barcode = ?, name = ?, price = ?, stock = ?, 
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ?
+                    """, (barcode, name, price, stock, product_id))
+                    self._invalidate_cache(product_ids=[product_id])
                 return True, "Producto actualizado exitosamente"
 
             # Caso: llamada por barcode
             if len(args) == 4 and isinstance(args[0], str):
                 barcode, name, price, stock = args
-                self.cursor.execute("""
-                    UPDATE products 
-                    SET name = ?, price = ?, stock = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE barcode = ?
-                """, (name, price, stock, barcode))
-                self.conn.commit()
+                with self._write() as cursor:
+                    cursor.execute("""
+                        UPDATE products 
+                        SET name = ?, price = ?, stock = ?, updated_at = CURRENT_TIMESTAMP
+                        WHERE barcode = ?
+                    """, (name, price, stock, barcode))
+                    self._invalidate_cache([barcode])
                 return True, "Producto actualizado exitosamente"
 
             return False, "Parámetros inválidos para update_product"
@@ -209,146 +943,924 @@ class Database:
             Tupla (éxito, mensaje)
         """
         try:
-            # Si recibe barcode, convertir a id
-            if isinstance(identifier, str):
-                self.cursor.execute("SELECT id FROM products WHERE barcode = ?", (identifier,))
-                row = self.cursor.fetchone()
-                if not row:
-                    return False, "Producto no encontrado"
-                product_id = row[0]
-            else:
-                product_id = identifier
+            with self._write() as cursor:
+                # Si recibe barcode, convertir a id
+                if isinstance(identifier, str):
+                    cursor.execute("SELECT id FROM products WHERE barcode = ?", (identifier,))
+                    row = cursor.fetchone()
+                    if not row:
+                        return False, "Producto no encontrado"
+                    product_id = row[0]
+                else:
+                    product_id = identifier
 
-            self.cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-            self.conn.commit()
+                cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+                self._invalidate_cache(product_ids=[product_id])
             return True, "Producto eliminado exitosamente"
         except Exception as e:
             return False, f"Error: {str(e)}"
     
-    def update_prices_bulk(self, percentage: float, product_ids: List[int] = None) -> Tuple[bool, str]:
+    def create_products(self, products: Iterable[Dict]) -> List[Tuple[bool, str, int]]:
+        """
+        Crea varios productos en una sola transacción
+        
+        Las filas inválidas o con un código de barras ya usado se informan
+        sin afectar al resto; las demás se insertan con un solo executemany.
+        
+        Args:
+            products: Diccionarios con barcode, name, price y stock (opcional)
+            
+        Returns:
+            Lista (en el mismo orden) de tuplas (éxito, mensaje, id del producto)
+        """
+        products = list(products)
+        results = [None] * len(products)
+        pending = []
+        
+        for index, data in enumerate(products):
+            row, error = validate_import_row(data)
+            if error:
+                results[index] = (False, error, -1)
+            else:
+                pending.append((index, row))
+        
+        rows = []
+        try:
+            with self._write() as cursor:
+                seen = self._existing_barcodes(row[0] for _index, row in pending)
+                for index, row in pending:
+                    if row[0] in seen:
+                        results[index] = (False, "Ya existe un producto con ese código de barras", -1)
+                    else:
+                        seen.add(row[0])
+                        rows.append((index, row))
+                
+                cursor.executemany("""
+                    INSERT INTO products (barcode, name, price, stock)
+                    VALUES (?, ?, ?, ?)
+                """, [row for _index, row in rows])
+                ids = self._barcode_ids(row[0] for _index, row in rows)
+        except sqlite3.Error as e:
+            for index, _row in rows:
+                results[index] = (False, f"Error: {str(e)}", -1)
+            return results
+        
+        for index, row in rows:
+            results[index] = (True, "Producto creado exitosamente", ids[row[0]])
+        return results
+    
+    def update_products(self, products: Iterable[Dict]) -> List[Tuple[bool, str]]:
+        """
+        Actualiza varios productos (por código de barras) en una sola
+        transacción
+        
+        Cada diccionario trae barcode y solo los campos a cambiar, por
+        ejemplo {'barcode': '779...', 'stock': 12} para corregir stock.
+        
+        Args:
+            products: Diccionarios con barcode y name, price y/o stock
+            
+        Returns:
+            Lista (en el mismo orden) de tuplas (éxito, mensaje)
+        """
+        products = list(products)
+        results = [None] * len(products)
+        pending = []
+        
+        for index, data in enumerate(products):
+            row, error = validate_update_row(data)
+            if error:
+                results[index] = (False, error)
+            else:
+                pending.append((index, row))
+        
+        rows = []
+        try:
+            with self._write() as cursor:
+                existing = self._existing_barcodes(row[3] for _index, row in pending)
+                for index, row in pending:
+                    if row[3] in existing:
+                        rows.append((index, row))
+                    else:
+                        results[index] = (False, "Producto no encontrado")
+                
+                cursor.executemany("""
+                    UPDATE products 
+                    SET name = COALESCE(?, name),
+                        price = COALESCE(?, price),
+                        stock = COALESCE(?, stock),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE barcode = ?
+                """, [row for _index, row in rows])
+                self._invalidate_cache(row[3] for _index, row in rows)
+        except sqlite3.Error as e:
+            for index, _row in rows:
+                results[index] = (False, f"Error: {str(e)}")
+            return results
+        
+        for index, _row in rows:
+            results[index] = (True, "Producto actualizado exitosamente")
+        return results
+    
+    def delete_products(self, barcodes: Iterable[str]) -> List[Tuple[bool, str]]:
+        """
+        Elimina varios productos por código de barras en una sola transacción
+        
+        Args:
+            barcodes: Códigos de barras a eliminar
+            
+        Returns:
+            Lista (en el mismo orden) de tuplas (éxito, mensaje)
+        """
+        barcodes = list(barcodes)
+        results = [(False, "Producto no encontrado")] * len(barcodes)
+        deleted = []
+        
+        try:
+            with self._write() as cursor:
+                existing = self._existing_barcodes(barcodes)
+                for index, barcode in enumerate(barcodes):
+                    if barcode in existing:
+                        existing.discard(barcode)
+                        deleted.append(index)
+                
+                cursor.executemany(
+                    "DELETE FROM products WHERE barcode = ?",
+                    [(barcodes[index],) for index in deleted]
+                )
+                self._invalidate_cache(barcodes[index] for index in deleted)
+        except sqlite3.Error as e:
+            for index in deleted:
+                results[index] = (False, f"Error: {str(e)}")
+            return results
+        
+        for index in deleted:
+            results[index] = (True, "Producto eliminado exitosamente")
+        return results
+    
+    def _price_filter(self, product_ids: Optional[List[int]] = None,
+                      name_pattern: Optional[str] = None,
+                      barcode_prefix: Optional[str] = None) -> Tuple[List[str], Dict, str]:
+        """
+        Arma el filtro SQL de un cambio masivo de precios
+        
+        Args:
+            product_ids: IDs de productos (None = sin filtrar por ID)
+            name_pattern: Texto o patrón LIKE (% y _) que debe cumplir el nombre
+            barcode_prefix: Comienzo del código de barras
+            
+        Returns:
+            Tupla (condiciones para el WHERE, parámetros, descripción)
+        """
+        conditions = []
+        params = {}
+        description = []
+        
+        if product_ids:
+            # Un solo parámetro JSON, sin el límite de parámetros por consulta
+            conditions.append("id IN (SELECT value FROM json_each(:product_ids))")
+            params['product_ids'] = json.dumps([int(product_id) for product_id in product_ids])
+            description.append(f"{len(product_ids)} producto(s) elegidos")
+        
+        if name_pattern:
+            if '%' not in name_pattern and '_' not in name_pattern:
+                name_pattern = f"%{name_pattern}%"
+            conditions.append("name LIKE :name_pattern")
+            params['name_pattern'] = name_pattern
+            description.append(f"nombre como '{name_pattern}'")
+        
+        if barcode_prefix:
+            # Rango sobre idx_barcode en lugar de LIKE 'prefijo%'
+            conditions.append("barcode >= :prefix_start AND barcode < :prefix_end")
+            params['prefix_start'] = barcode_prefix
+            params['prefix_end'] = barcode_prefix[:-1] + chr(ord(barcode_prefix[-1]) + 1)
+            description.append(f"código que empieza con '{barcode_prefix}'")
+        
+        return conditions, params, ', '.join(description) or "todos los productos"
+    
+    def preview_price_update(self, percentage: float, product_ids: Optional[List[int]] = None,
+                             name_pattern: Optional[str] = None,
+                             barcode_prefix: Optional[str] = None) -> Dict:
+        """
+        Calcula, sin modificar nada, el efecto de un cambio masivo de precios
+        (una sola consulta de agregación)
+        
+        Args:
+            percentage: Porcentaje de cambio (positivo o negativo)
+            product_ids: IDs de productos (None = todos)
+            name_pattern: Texto o patrón LIKE que debe cumplir el nombre
+            barcode_prefix: Comienzo del código de barras
+            
+        Returns:
+            Diccionario con products (alcanzados), changed (cuyo precio cambia),
+            min/max/avg del precio antes y después y el valor del stock antes
+            y después
+        """
+        conditions, params, _description = self._price_filter(product_ids, name_pattern, barcode_prefix)
+        params['multiplier'] = 1 + (percentage / 100)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        # LIMIT -1 evita que SQLite aplane la subconsulta: ROUND se calcula una
+        # vez por fila y no en cada agregado (lo mismo que AS MATERIALIZED,
+        # que requiere SQLite 3.35)
+        cursor = self._read()
+        cursor.execute(f"""
+            WITH preview AS (
+                SELECT price, stock, ROUND(price * :multiplier, 2) AS new_price
+                FROM products {where}
+                LIMIT -1
+            )
+            SELECT COUNT(*) AS products,
+                   COALESCE(SUM(new_price != price), 0) AS changed,
+                   MIN(price) AS min_before,
+                   MAX(price) AS max_before,
+                   AVG(price) AS avg_before,
+                   MIN(new_price) AS min_after,
+                   MAX(new_price) AS max_after,
+                   AVG(new_price) AS avg_after,
+                   COALESCE(SUM(price * stock), 0) AS value_before,
+                   COALESCE(SUM(new_price * stock), 0) AS value_after
+            FROM preview
+        """, params)
+        
+        preview = dict(cursor.fetchone())
+        for key, value in preview.items():
+            if isinstance(value, float):
+                preview[key] = round(value, 2)
+        return preview
+    
+    def update_prices_bulk(self, percentage: float, product_ids: List[int] = None,
+                           name_pattern: Optional[str] = None,
+                           barcode_prefix: Optional[str] = None) -> Tuple[bool, str]:
         """
         Actualiza precios de forma masiva
         
+        Solo se reescriben los productos cuyo precio realmente cambia, y su
+        precio anterior queda en el registro de cambios (price_batches) para
+        poder deshacerlo con revert_price_batch.
+        
         Args:
             percentage: Porcentaje de cambio (positivo o negativo)
             product_ids: Lista de IDs de productos (None = todos)
+            name_pattern: Texto o patrón LIKE que debe cumplir el nombre
+            barcode_prefix: Comienzo del código de barras
             
         Returns:
             Tupla (éxito, mensaje)
         """
         try:
-            multiplier = 1 + (percentage / 100)
+            conditions, params, description = self._price_filter(
+                product_ids, name_pattern, barcode_prefix
+            )
+            params['multiplier'] = 1 + (percentage / 100)
+            conditions.append("ROUND(price * :multiplier, 2) != price")
             
-            if product_ids:
-                # Actualizar solo productos específicos
-                placeholders = ','.join('?' * len(product_ids))
-                self.cursor.execute(f"""
-                    UPDATE products 
-                    SET price = ROUND(price * ?, 2), 
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id IN ({placeholders})
-                """, [multiplier] + product_ids)
-            else:
-                # Actualizar todos los productos
-                self.cursor.execute("""
+            with self._write() as cursor:
+                cursor.execute("""
+                    INSERT INTO price_batches (percentage, description) VALUES (?, ?)
+                """, (percentage, description))
+                params['batch_id'] = cursor.lastrowid
+                
+                cursor.execute(f"""
+                    INSERT INTO price_batch_items (batch_id, product_id, old_price)
+                    SELECT :batch_id, id, price FROM products
+                    WHERE {' AND '.join(conditions)}
+                """, params)
+                
+                cursor.execute("""
                     UPDATE products 
-                    SET price = ROUND(price * ?, 2),
+                    SET price = ROUND(price * :multiplier, 2),
                         updated_at = CURRENT_TIMESTAMP
-                """, (multiplier,))
+                    WHERE id IN (SELECT product_id FROM price_batch_items WHERE batch_id = :batch_id)
+                """, params)
+                affected = cursor.rowcount
+                
+                if affected:
+                    cursor.execute(
+                        "UPDATE price_batches SET product_count = ? WHERE id = ?",
+                        (affected, params['batch_id'])
+                    )
+                    self._prune_price_journal(cursor)
+                else:
+                    cursor.execute("DELETE FROM price_batches WHERE id = ?", (params['batch_id'],))
+                
+                if product_ids or name_pattern or barcode_prefix:
+                    self._invalidate_cache(product_ids=self._price_batch_product_ids(params['batch_id']))
+                else:
+                    self._invalidate_cache(everything=True)
             
-            self.conn.commit()
-            affected = self.cursor.rowcount
             return True, f"{affected} producto(s) actualizado(s)"
         except Exception as e:
             return False, f"Error: {str(e)}"
     
-    def import_from_csv_data(self, products_data: List[Dict]) -> Dict:
+    def revert_price_batch(self, batch_id: Optional[int] = None) -> Tuple[bool, str]:
+        """
+        Deshace un cambio masivo de precios con una sola sentencia
+        
+        Solo se restauran los productos cuyo precio sigue siendo el que dejó
+        ese cambio; los que se modificaron después no se tocan.
+        
+        Args:
+            batch_id: Cambio a deshacer (None = el último sin deshacer)
+            
+        Returns:
+            Tupla (éxito, mensaje)
+        """
+        try:
+            with self._write() as cursor:
+                if batch_id is None:
+                    cursor.execute("""
+                        SELECT id, percentage, product_count, reverted_at FROM price_batches
+                        WHERE reverted_at IS NULL ORDER BY id DESC LIMIT 1
+                    """)
+                else:
+                    cursor.execute("""
+                        SELECT id, percentage, product_count, reverted_at FROM price_batches
+                        WHERE id = ?
+                    """, (batch_id,))
+                batch = cursor.fetchone()
+                
+                if batch is None:
+                    return False, "No hay cambios de precios para deshacer"
+                if batch['reverted_at'] is not None:
+                    return False, "Ese cambio de precios ya fue deshecho"
+                
+                # Subconsulta correlacionada y no UPDATE ... FROM (SQLite 3.33+)
+                cursor.execute("""
+                    UPDATE products
+                    SET price = (
+                            SELECT j.old_price FROM price_batch_items AS j
+                            WHERE j.batch_id = :batch_id AND j.product_id = products.id
+                        ),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id IN (SELECT product_id FROM price_batch_items WHERE batch_id = :batch_id)
+                      AND price = (
+                            SELECT ROUND(j.old_price * :multiplier, 2) FROM price_batch_items AS j
+                            WHERE j.batch_id = :batch_id AND j.product_id = products.id
+                        )
+                """, {'batch_id': batch['id'], 'multiplier': 1 + (batch['percentage'] / 100)})
+                restored = cursor.rowcount
+                
+                cursor.execute(
+                    "UPDATE price_batches SET reverted_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (batch['id'],)
+                )
+                self._invalidate_cache(everything=True)
+            
+            message = f"{restored} precio(s) restaurado(s)"
+            skipped = batch['product_count'] - restored
+            if skipped > 0:
+                message += f" ({skipped} con cambios posteriores no se tocaron)"
+            return True, message
+        except Exception as e:
+            return False, f"Error: {str(e)}"
+    
+    def get_price_batches(self, limit: int = PRICE_JOURNAL_BATCHES) -> List[Record]:
+        """
+        Lista los últimos cambios masivos de precios
+        
+        Args:
+            limit: Cantidad máxima de cambios
+            
+        Returns:
+            Registros con id, percentage, description, product_count,
+            created_at y reverted_at, del más nuevo al más viejo
+        """
+        return self._fetch_records("""
+            SELECT id, percentage, description, product_count, created_at, reverted_at
+            FROM price_batches ORDER BY id DESC LIMIT ?
+        """, (limit,))
+    
+    def _price_batch_product_ids(self, batch_id: int) -> Set[int]:
+        """IDs de los productos modificados por un cambio masivo"""
+        cursor = self._read()
+        cursor.execute("SELECT product_id FROM price_batch_items WHERE batch_id = ?", (batch_id,))
+        return {row[0] for row in cursor.fetchall()}
+    
+    def _prune_price_journal(self, cursor: sqlite3.Cursor):
+        """Borra del registro los cambios más viejos que PRICE_JOURNAL_BATCHES"""
+        cursor.execute("""
+            SELECT id FROM price_batches ORDER BY id DESC LIMIT 1 OFFSET ?
+        """, (PRICE_JOURNAL_BATCHES,))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        
+        cursor.execute("DELETE FROM price_batch_items WHERE batch_id <= ?", (row[0],))
+        cursor.execute("DELETE FROM price_batches WHERE id <= ?", (row[0],))
+    
+    def import_from_csv_data(self, products_data: Iterable[Dict],
+                             chunk_size: int = IMPORT_CHUNK_SIZE,
+                             progress: Optional[Callable[[Dict], None]] = None,
+                             cancel: Optional[Callable[[], bool]] = None) -> Dict:
         """
         Importa productos desde datos CSV
         
+        Los productos válidos se insertan o actualizan por lotes con
+        INSERT ... ON CONFLICT(barcode) DO UPDATE, una transacción por lote.
+        Como products_data puede ser un generador, la memoria usada no
+        depende del tamaño del archivo.
+        
         Args:
-            products_data: Lista de diccionarios con datos de productos
+            products_data: Iterable de diccionarios con datos de productos
+            chunk_size: Cantidad de productos por lote
+            progress: Callback llamado con las estadísticas después de cada lote
+            cancel: Función consultada antes de cada lote; si devuelve True se
+                detiene la importación descartando el lote pendiente
             
         Returns:
             Diccionario con estadísticas de importación
         """
-        imported = 0
-        updated = 0
-        errors = []
+        stats = new_import_stats()
         
-        for data in products_data:
-            try:
-                barcode = data.get('barcode', '').strip()
-                name = data.get('name', '').strip()
-                price = float(data.get('price', 0))
-                stock = int(data.get('stock', 0))
-                
-                if not barcode or not name or price <= 0:
-                    errors.append(f"Datos inválidos: {barcode}")
+        def valid_rows():
+            for data in products_data:
+                stats['total'] += 1
+                row, error = validate_import_row(data)
+                if error:
+                    stats['errors'].append(error)
                     continue
+                yield row
+        
+        return self.import_rows(valid_rows(), chunk_size, progress, cancel, stats)
+    
+    def import_rows(self, rows: Iterable[Tuple[str, str, float, int]],
+                    chunk_size: int = IMPORT_CHUNK_SIZE,
+                    progress: Optional[Callable[[Dict], None]] = None,
+                    cancel: Optional[Callable[[], bool]] = None,
+                    stats: Optional[Dict] = None) -> Dict:
+        """
+        Inserta o actualiza por lotes productos ya validados
+        
+        Args:
+            rows: Tuplas (barcode, name, price, stock) válidas
+            chunk_size: Cantidad de productos por lote
+            progress: Callback llamado con las estadísticas después de cada lote
+            cancel: Función consultada antes de cada lote; si devuelve True se
+                detiene la importación descartando el lote pendiente
+            stats: Estadísticas a completar. Quien las pasa es responsable de
+                llevar 'total' y los errores de validación; si se omiten se
+                crean nuevas y 'total' cuenta las filas recibidas.
+            
+        Returns:
+            Diccionario con estadísticas de importación
+        """
+        counted = stats is None
+        if counted:
+            stats = new_import_stats()
+        chunk = []
+        
+        def flush():
+            if cancel and cancel():
+                stats['cancelled'] = True
+                return False
+            if chunk:
+                self._upsert_chunk(chunk, stats)
+            if progress:
+                progress(stats)
+            return True
+        
+        for row in rows:
+            if counted:
+                stats['total'] += 1
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                if not flush():
+                    return stats
+                chunk = []
+        
+        if chunk or progress:
+            flush()
+        
+        return stats
+    
+    def _upsert_chunk(self, rows: List[Tuple[str, str, float, int]], stats: Dict):
+        """
+        Inserta o actualiza un lote de productos en una sola transacción
+        
+        Args:
+            rows: Tuplas (barcode, name, price, stock) ya validadas
+            stats: Estadísticas de importación a actualizar
+        """
+        try:
+            with self._write() as cursor:
+                # Contar nuevos/actualizados igual que fila por fila
+                seen = self._existing_barcodes({row[0] for row in rows})
+                imported = 0
+                updated = 0
+                for row in rows:
+                    if row[0] in seen:
+                        updated += 1
+                    else:
+                        imported += 1
+                        seen.add(row[0])
                 
-                # Verificar si existe
-                existing = self.get_product_by_barcode(barcode)
-                
-                if existing:
-                    # Actualizar
-                    self.cursor.execute("""
-                        UPDATE products 
-                        SET name = ?, price = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE barcode = ?
-                    """, (name, price, barcode))
-                    updated += 1
-                else:
-                    # Crear nuevo
-                    self.cursor.execute("""
-                        INSERT INTO products (barcode, name, price, stock)
-                        VALUES (?, ?, ?, ?)
-                    """, (barcode, name, price, stock))
-                    imported += 1
-                
-            except Exception as e:
-                errors.append(f"Error en {data.get('barcode', 'desconocido')}: {str(e)}")
+                # Existentes: solo nombre y precio (el stock no se pisa)
+                cursor.executemany("""
+                    INSERT INTO products (barcode, name, price, stock)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(barcode) DO UPDATE SET
+                        name = excluded.name,
+                        price = excluded.price,
+                        updated_at = CURRENT_TIMESTAMP
+                """, rows)
+                self._invalidate_cache(row[0] for row in rows)
+        except sqlite3.Error as e:
+            stats['errors'].extend(f"Error en {row[0]}: {str(e)}" for row in rows)
+            return
         
-        self.conn.commit()
+        stats['imported'] += imported
+        stats['updated'] += updated
+    
+    def _select_by_barcodes(self, columns: str, barcodes: Iterable[str]) -> Iterator[Record]:
+        """
+        Recorre las filas de products cuyos códigos están en barcodes
         
-        return {
-            'imported': imported,
-            'updated': updated,
-            'errors': errors,
-            'total': len(products_data)
-        }
+        Args:
+            columns: Columnas del SELECT
+            barcodes: Códigos de barras a buscar
+            
+        Yields:
+            Filas encontradas (en cualquier orden)
+        """
+        barcodes = list(barcodes)
+        
+        # SQLite limita la cantidad de parámetros por consulta
+        for start in range(0, len(barcodes), MAX_SQL_PARAMS):
+            batch = barcodes[start:start + MAX_SQL_PARAMS]
+            placeholders = ','.join('?' * len(batch))
+            yield from self._fetch_records(
+                f"SELECT {columns} FROM products WHERE barcode IN ({placeholders})", batch
+            )
+    
+    def _existing_barcodes(self, barcodes: Iterable[str]) -> Set[str]:
+        """
+        Devuelve cuáles de los códigos de barras ya existen
+        
+        Args:
+            barcodes: Códigos de barras a buscar
+            
+        Returns:
+            Conjunto de códigos existentes
+        """
+        return {row[0] for row in self._select_by_barcodes("barcode", barcodes)}
+    
+    def _barcode_ids(self, barcodes: Iterable[str]) -> Dict[str, int]:
+        """
+        Devuelve el id de cada código de barras existente
+        
+        Args:
+            barcodes: Códigos de barras a buscar
+            
+        Returns:
+            Diccionario código -> id
+        """
+        return {row[0]: row[1] for row in self._select_by_barcodes("barcode, id", barcodes)}
     
     def get_stats(self) -> Dict:
         """
         Obtiene estadísticas del inventario
         
+        Se leen de la tabla product_stats, que los triggers mantienen al día
+        con cada alta, baja o cambio de precio/stock (tiempo constante).
+        
         Returns:
             Diccionario con estadísticas
         """
-        # Total de productos
-        self.cursor.execute("SELECT COUNT(*) FROM products")
-        total_products = self.cursor.fetchone()[0]
+        cursor = self._read()
+        cursor.execute("""
+            SELECT total_products, total_value, total_stock, low_stock
+            FROM product_stats WHERE id = 1
+        """)
+        row = cursor.fetchone()
+        if row is None:
+            return self.refresh_stats()
         
-        # Valor total del inventario
-        self.cursor.execute("SELECT SUM(price * stock) FROM products")
-        total_value = self.cursor.fetchone()[0] or 0
+        return {
+            'total_products': row['total_products'],
+            'total_value': round(row['total_value'], 2),
+            'total_stock': row['total_stock'],
+            'low_stock': row['low_stock']
+        }
+    
+    def refresh_stats(self) -> Dict:
+        """
+        Recalcula las estadísticas desde cero con una sola consulta y las
+        guarda en product_stats
         
-        # Total de unidades en stock
-        self.cursor.execute("SELECT SUM(stock) FROM products")
-        total_stock = self.cursor.fetchone()[0] or 0
+        Returns:
+            Diccionario con estadísticas
+        """
+        with self._write() as cursor:
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO product_stats
+                    (id, total_products, total_value, total_stock, low_stock)
+                SELECT 1,
+                       COUNT(*),
+                       COALESCE(SUM(price * stock), 0),
+                       COALESCE(SUM(stock), 0),
+                       COALESCE(SUM(stock < {LOW_STOCK_SQL}), 0)
+                FROM products
+            """)
+        return self.get_stats()
+    
+    def get_low_stock_threshold(self) -> int:
+        """
+        Obtiene el umbral de stock bajo configurado
         
-        # Productos con stock bajo (< 5)
-        self.cursor.execute("SELECT COUNT(*) FROM products WHERE stock < 5")
-        low_stock = self.cursor.fetchone()[0]
+        Returns:
+            Productos con stock menor a este valor se consideran con stock bajo
+        """
+        cursor = self._read()
+        cursor.execute(f"SELECT {LOW_STOCK_SQL}")
+        value = cursor.fetchone()[0]
+        return DEFAULT_LOW_STOCK_THRESHOLD if value is None else value
+    
+    def set_low_stock_threshold(self, threshold: int) -> Tuple[bool, str]:
+        """
+        Cambia el umbral de stock bajo y recalcula el contador de stock bajo
         
-        return {
-            'total_products': total_products,
-            'total_value': round(total_value, 2),
-            'total_stock': total_stock,
-            'low_stock': low_stock
-        }
+        Args:
+            threshold: Nuevo umbral (mayor o igual a 0)
+            
+        Returns:
+            Tupla (éxito, mensaje)
+        """
+        if threshold < 0:
+            return False, "El umbral no puede ser negativo"
+        
+        try:
+            with self._write() as cursor:
+                cursor.execute("""
+                    INSERT OR REPLACE INTO settings (key, value) VALUES ('low_stock_threshold', ?)
+                """, (str(int(threshold)),))
+                # Conteo por rango sobre idx_stock
+                cursor.execute("""
+                    UPDATE product_stats
+                    SET low_stock = (SELECT COUNT(*) FROM products WHERE stock < ?)
+                    WHERE id = 1
+                """, (int(threshold),))
+            return True, "Umbral de stock bajo actualizado"
+        except Exception as e:
+            return False, f"Error: {str(e)}"
+    
+    def get_price_history(self, product_id: int, since: Optional[str] = None,
+                          limit: Optional[int] = None) -> List[Record]:
+        """
+        Cambios de precio de un producto, del más nuevo al más viejo
+        
+        Args:
+            product_id: ID del producto
+            since: Solo cambios desde esta fecha ('YYYY-MM-DD' o con hora)
+            limit: Cantidad máxima de cambios
+            
+        Returns:
+            Registros con old_price (None en el alta), new_price y changed_at
+        """
+        sql = """
+            SELECT old_price, new_price, changed_at FROM price_history
+            WHERE product_id = ? AND changed_at >= ?
+            ORDER BY changed_at DESC, id DESC
+        """
+        params = [product_id, _history_time(since) if since else '']
+        
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        return self._fetch_records(sql, params)
+    
+    def get_price_at(self, product_id: int, when) -> Optional[float]:
+        """
+        Precio que tenía un producto en un momento dado
+        
+        Args:
+            product_id: ID del producto
+            when: Fecha (date o 'YYYY-MM-DD', se toma el final del día) o
+                fecha y hora (datetime o 'YYYY-MM-DD HH:MM:SS', en UTC)
+            
+        Returns:
+            Precio vigente en ese momento, o None si el producto no existía
+        """
+        cursor = self._read()
+        cursor.execute("""
+            SELECT new_price FROM price_history
+            WHERE product_id = ? AND changed_at <= ?
+            ORDER BY changed_at DESC, id DESC
+            LIMIT 1
+        """, (product_id, _history_time(when, end_of_day=True)))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    
+    def get_price_changes(self, days: int = 90, limit: Optional[int] = None) -> List[Record]:
+        """
+        Productos cuyo precio cambió en los últimos días, con la variación
+        
+        Recorre solo las filas del período (idx_price_history_changed) y
+        busca el precio anterior de cada producto por idx_price_history_product.
+        
+        Args:
+            days: Tamaño de la ventana en días
+            limit: Cantidad máxima de productos (los de mayor variación primero)
+            
+        Returns:
+            Registros con product_id, barcode, name, changes, price_before
+            (None si el producto es nuevo), price_now y change_pct
+        """
+        sql = """
+            WITH recent AS (
+                SELECT product_id, COUNT(*) AS changes
+                -- Sin INDEXED BY el planificador prefiere recorrer todo
+                -- idx_price_history_product para evitar ordenar el GROUP BY
+                FROM price_history INDEXED BY idx_price_history_changed
+                WHERE changed_at >= datetime('now', :offset)
+                GROUP BY product_id
+            ),
+            changed AS (
+                SELECT w.product_id, p.barcode, p.name, w.changes, p.price AS price_now,
+                       (SELECT b.new_price FROM price_history b
+                        WHERE b.product_id = w.product_id
+                          AND b.changed_at < datetime('now', :offset)
+                        ORDER BY b.changed_at DESC, b.id DESC
+                        LIMIT 1) AS price_before
+                FROM recent w
+                JOIN products p ON p.id = w.product_id
+            )
+            SELECT product_id, barcode, name, changes, price_before, price_now,
+                   ROUND((price_now - price_before) * 100.0 / price_before, 2) AS change_pct
+            FROM changed
+            WHERE price_before IS NULL OR price_before != price_now
+            ORDER BY change_pct IS NULL, ABS(change_pct) DESC, name
+        """
+        params = {'offset': f"-{int(days)} days"}
+        
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params['limit'] = limit
+        
+        return self._fetch_records(sql, params)
+    
+    def adjust_stock(self, barcode: str, delta: int,
+                     reason: str = STOCK_REASON_ADJUSTMENT) -> Tuple[bool, str, int]:
+        """
+        Suma (o resta) unidades al stock de un producto
+        
+        A diferencia de update_product no pisa el valor: dos ventas
+        simultáneas descuentan las dos. Nunca deja el stock en negativo.
+        
+        Args:
+            barcode: Código de barras
+            delta: Unidades a sumar (negativo para descontar)
+            reason: Motivo del movimiento (ej. STOCK_REASON_SALE)
+            
+        Returns:
+            Tupla (éxito, mensaje, stock resultante o -1)
+        """
+        return self.adjust_stock_batch([(barcode, delta)], reason)[0]
+    
+    def adjust_stock_batch(self, movements: Iterable[Tuple[str, int]],
+                           reason: str = STOCK_REASON_ADJUSTMENT,
+                           all_or_nothing: bool = False) -> List[Tuple[bool, str, int]]:
+        """
+        Aplica varios movimientos de stock (por ejemplo las ventas del día)
+        en una sola transacción
+        
+        Cada movimiento es un UPDATE stock = stock + delta que solo se aplica
+        si el resultado no es negativo; los movimientos de un mismo producto
+        se encadenan en orden. Un delta que no es entero se informa en su
+        fila, igual que un código inexistente.
+        
+        Args:
+            movements: Pares (barcode, delta)
+            reason: Motivo de todos los movimientos
+            all_or_nothing: Si alguno falla, no aplicar ninguno
+            
+        Returns:
+            Lista (en el mismo orden) de tuplas (éxito, mensaje, stock resultante o -1)
+        """
+        movements = list(movements)
+        results = []
+        
+        try:
+            with self._write() as cursor:
+                # El trigger de stock_movements toma el motivo de stock_context
+                cursor.execute(
+                    "INSERT OR REPLACE INTO stock_context (id, reason) VALUES (1, ?)", (reason,)
+                )
+                
+                for barcode, delta in movements:
+                    try:
+                        delta = int(delta)
+                    except (TypeError, ValueError):
+                        results.append((False, f"Cantidad inválida: {barcode}", -1))
+                        continue
+                    
+                    cursor.execute("""
+                        UPDATE products
+                        SET stock = stock + :delta, updated_at = CURRENT_TIMESTAMP
+                        WHERE barcode = :barcode AND stock + :delta >= 0
+                    """, {'barcode': barcode, 'delta': delta})
+                    
+                    # Sin RETURNING (requiere SQLite 3.35): se lee el stock
+                    # resultante dentro de la misma transacción
+                    if cursor.rowcount > 0:
+                        cursor.execute("SELECT stock FROM products WHERE barcode = ?", (barcode,))
+                        results.append((True, "Stock actualizado", cursor.fetchone()[0]))
+                    elif self._existing_barcodes([barcode]):
+                        results.append((False, f"Stock insuficiente: {barcode}", -1))
+                    else:
+                        results.append((False, f"Producto no encontrado: {barcode}", -1))
+                
+                if all_or_nothing and not all(success for success, _msg, _stock in results):
+                    raise _BatchRejected()
+                
+                cursor.execute("DELETE FROM stock_context")
+                
+                self._invalidate_cache(
+                    barcode for (barcode, _delta), (success, _msg, _stock) in zip(movements, results)
+                    if success
+                )
+        except _BatchRejected:
+            return [
+                result if not result[0] else (False, "No aplicado: hay errores en el lote", -1)
+                for result in results
+            ]
+        except sqlite3.Error as e:
+            return [(False, f"Error: {str(e)}", -1)] * len(movements)
+        
+        return results
+    
+    def get_stock_movements(self, product_id: int, limit: Optional[int] = None) -> List[Record]:
+        """
+        Movimientos de stock de un producto, del más nuevo al más viejo
+        
+        Args:
+            product_id: ID del producto
+            limit: Cantidad máxima de movimientos
+            
+        Returns:
+            Registros con delta, stock_after, reason y created_at
+        """
+        sql = """
+            SELECT delta, stock_after, reason, created_at FROM stock_movements
+            WHERE product_id = ?
+            ORDER BY created_at DESC, id DESC
+        """
+        params = [product_id]
+        
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        return self._fetch_records(sql, params)
+    
+    def check_stock_ledger(self) -> List[Record]:
+        """
+        Verifica que el stock de cada producto coincida con la suma de sus
+        movimientos
+        
+        Returns:
+            Registros (product_id, stock, ledger) de los productos que no
+            coinciden; lista vacía si todo está en orden
+        """
+        return self._fetch_records("""
+            SELECT p.id AS product_id, p.stock, COALESCE(m.total, 0) AS ledger
+            FROM products p
+            LEFT JOIN (
+                SELECT product_id, SUM(delta) AS total FROM stock_movements GROUP BY product_id
+            ) m ON m.product_id = p.id
+            WHERE p.stock != COALESCE(m.total, 0)
+        """)
+    
+    def get_low_stock_products(self, limit: Optional[int] = None, offset: int = 0) -> List[Record]:
+        """
+        Reporte de productos con stock por debajo del umbral
+        
+        Se resuelve con un recorrido por rango sobre idx_stock, sin escanear
+        la tabla.
+        
+        Args:
+            limit: Cantidad máxima de resultados (None = todos)
+            offset: Cantidad de resultados a saltear (paginado)
+            
+        Returns:
+            Lista de productos, de menor a mayor stock
+        """
+        sql = """
+            SELECT id, barcode, name, price, stock FROM products
+            WHERE stock < ?
+            ORDER BY stock, name
+        """
+        params = [self.get_low_stock_threshold()]
+        
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        
+        return self._fetch_records(sql, params)
     
     def close(self):
-        """Cierra la conexión a la base de datos"""
-        if self.conn:
-            self.conn.close()
+        """Libera las conexiones a la base de datos"""
+        if self.connections:
+            self.connections.release()
+            self.connections = None
@@ -0,0 +1,72 @@
+"""
+Exportación de productos a CSV para Oaky Desktop
+Escribe en streaming, por lotes, sin cargar el catálogo en memoria
+"""
+
+import csv
+import os
+from typing import Callable, Dict, Optional
+
+from database import Database, ITER_BATCH_SIZE
+
+
+EXPORT_COLUMNS = ('barcode', 'name', 'price', 'stock')
+
+
+def export_csv_file(db: Database, file_path: str,
+                    batch_size: int = ITER_BATCH_SIZE,
+                    progress: Optional[Callable[[Dict], None]] = None,
+                    cancel: Optional[Callable[[], bool]] = None) -> Dict:
+    """
+    Exporta todos los productos a un archivo CSV
+
+    Se escribe primero a un archivo temporal junto al destino y se renombra
+    al terminar, así una exportación cancelada o fallida no deja un CSV a
+    medias.
+
+    Args:
+        db: Base de datos de origen
+        file_path: Ruta del archivo CSV a crear
+        batch_size: Filas leídas y escritas por lote
+        progress: Callback con {'processed', 'total', 'fraction'} por lote
+        cancel: Función consultada antes de cada lote; si devuelve True se
+            descarta lo escrito
+
+    Returns:
+        Diccionario con exported, total y cancelled
+    """
+    total = db.get_stats()['total_products']
+    exported = 0
+    cancelled = False
+    temp_path = f"{file_path}.tmp"
+
+    try:
+        with open(temp_path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_COLUMNS)
+
+            for rows in db.iter_products(batch_size, EXPORT_COLUMNS):
+                if cancel and cancel():
+                    cancelled = True
+                    break
+
+                writer.writerows(rows)
+                exported += len(rows)
+
+                if progress:
+                    progress({
+                        'processed': exported,
+                        'total': total,
+                        'fraction': exported / total if total else 1.0
+                    })
+
+        if cancelled:
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return {'exported': exported, 'total': total, 'cancelled': cancelled}
@@ -0,0 +1,284 @@
+"""
+Importación de productos desde CSV para Oaky Desktop
+Lee, normaliza y valida en streaming, sin cargar el archivo en memoria
+"""
+
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from database import Database, IMPORT_CHUNK_SIZE, new_import_stats, validate_import_row
+
+
+# Políticas para códigos repetidos entre archivos:
+# 'last'  -> gana el último archivo (y la última fila) en aparecer
+# 'first' -> gana el primero (los archivos se pasan en orden de prioridad)
+DEDUPE_POLICIES = ('last', 'first')
+
+
+def normalize_row(row: Dict) -> Dict:
+    """
+    Limpia una fila del CSV antes de validarla
+
+    Los archivos de proveedores traen el precio con espacios de relleno
+    (por ejemplo "  28608 ").
+
+    Args:
+        row: Fila leída por csv.DictReader
+
+    Returns:
+        La misma fila normalizada
+    """
+    price = row.get('price')
+    if price is not None:
+        row['price'] = price.strip().replace(' ', '')
+    return row
+
+
+class CsvProductReader:
+    """
+    Iterable sobre las filas normalizadas de un CSV de productos.
+
+    El archivo se lee línea por línea en binario para poder informar el
+    avance en bytes; nunca se guarda completo en memoria.
+    """
+
+    def __init__(self, file_path: str, encoding: str = 'utf-8'):
+        """
+        Args:
+            file_path: Ruta al archivo CSV
+            encoding: Codificación del archivo
+        """
+        self.file_path = file_path
+        self.encoding = encoding
+        self.size = os.path.getsize(file_path)
+        self.bytes_read = 0
+
+    @property
+    def fraction(self) -> float:
+        """Porción del archivo leída (0 a 1)"""
+        return self.bytes_read / self.size if self.size else 1.0
+
+    def __iter__(self) -> Iterator[Dict]:
+        self.bytes_read = 0
+        with open(self.file_path, 'rb') as file:
+            for row in csv.DictReader(self._lines(file)):
+                yield normalize_row(row)
+
+    def _lines(self, file) -> Iterator[str]:
+        """Decodifica el archivo línea por línea contando los bytes leídos"""
+        for index, line in enumerate(file):
+            self.bytes_read += len(line)
+            # La primera línea puede traer BOM (archivos guardados con Excel)
+            yield line.decode('utf-8-sig' if index == 0 else self.encoding)
+
+
+def first_occurrences(rows: Iterable[Dict], seen: Set[str], skipped: List[int]) -> Iterator[Dict]:
+    """
+    Deja pasar solo la primera fila válida de cada código de barras
+
+    Las filas inválidas pasan igual, para que la importación registre el
+    error; no cuentan como primera aparición.
+
+    Args:
+        rows: Filas normalizadas
+        seen: Códigos ya importados; se completa con los nuevos
+        skipped: Lista de un elemento donde se cuentan las filas descartadas
+    """
+    for data in rows:
+        row, _error = validate_import_row(data)
+        if row is not None:
+            if row[0] in seen:
+                skipped[0] += 1
+                continue
+            seen.add(row[0])
+        yield data
+
+
+def import_csv_file(db: Database, file_path: str,
+                    chunk_size: int = IMPORT_CHUNK_SIZE,
+                    progress: Optional[Callable[[Dict], None]] = None,
+                    cancel: Optional[Callable[[], bool]] = None,
+                    seen: Optional[Set[str]] = None) -> Dict:
+    """
+    Importa un archivo CSV en streaming: lee, normaliza, valida y guarda
+    por lotes acotados
+
+    Args:
+        db: Base de datos destino
+        file_path: Ruta al archivo CSV
+        chunk_size: Cantidad de productos por lote (una transacción cada uno)
+        progress: Callback con un resumen después de cada lote
+            (processed, imported, updated, errors, fraction)
+        cancel: Función consultada antes de cada lote; si devuelve True la
+            importación se detiene y el lote pendiente se descarta
+        seen: Para la política 'first': códigos ya importados (de este u
+            otros archivos); solo se importa la primera fila válida de cada
+            uno. Se completa con los códigos nuevos, así que se puede pasar
+            el mismo conjunto a varios archivos seguidos.
+
+    Returns:
+        Diccionario con estadísticas de importación (más 'duplicates' si se
+        pasó seen)
+    """
+    reader = CsvProductReader(file_path)
+    skipped = [0]
+
+    def report(stats):
+        progress({
+            'processed': stats['total'],
+            'imported': stats['imported'],
+            'updated': stats['updated'],
+            'errors': len(stats['errors']),
+            'fraction': reader.fraction
+        })
+
+    stats = db.import_from_csv_data(
+        reader if seen is None else first_occurrences(reader, seen, skipped),
+        chunk_size,
+        progress=report if progress else None,
+        cancel=cancel
+    )
+    if seen is not None:
+        stats['duplicates'] = skipped[0]
+        stats['total'] += skipped[0]
+    return stats
+
+
+def parse_csv_file(file_path: str) -> Dict:
+    """
+    Lee y valida un CSV completo. Se ejecuta en un proceso aparte, por eso
+    devuelve solo datos simples.
+
+    Args:
+        file_path: Ruta al archivo CSV
+
+    Returns:
+        Diccionario con rows (tuplas válidas), errors y total
+    """
+    rows = []
+    errors = []
+    total = 0
+
+    for data in CsvProductReader(file_path):
+        total += 1
+        row, error = validate_import_row(data)
+        if error:
+            errors.append(error)
+        else:
+            rows.append(row)
+
+    return {'rows': rows, 'errors': errors, 'total': total}
+
+
+def merge_parsed_files(parsed: Sequence[Dict], policy: str = 'last') -> Tuple[Dict[str, tuple], int]:
+    """
+    Combina los resultados de varios archivos quitando códigos repetidos
+
+    Args:
+        parsed: Resultados de parse_csv_file, en el orden de los archivos
+        policy: Política de duplicados (ver DEDUPE_POLICIES)
+
+    Returns:
+        Tupla (filas por código de barras, cantidad de duplicados descartados)
+    """
+    merged = {}
+    duplicates = 0
+
+    for result in parsed:
+        for row in result['rows']:
+            if row[0] in merged:
+                duplicates += 1
+                if policy == 'first':
+                    continue
+            merged[row[0]] = row
+
+    return merged, duplicates
+
+
+def import_csv_files(db: Database, file_paths: Sequence[str], policy: str = 'last',
+                     chunk_size: int = IMPORT_CHUNK_SIZE,
+                     progress: Optional[Callable[[Dict], None]] = None,
+                     cancel: Optional[Callable[[], bool]] = None,
+                     max_workers: Optional[int] = None) -> Dict:
+    """
+    Importa varios archivos CSV a la vez
+
+    Cada archivo se lee y valida en un proceso distinto; luego los
+    resultados se combinan quitando códigos repetidos según la política y
+    un único flujo se guarda por lotes en la base de datos. A diferencia de
+    import_csv_file, las filas válidas (una por código) quedan en memoria
+    para poder deduplicar.
+
+    Args:
+        db: Base de datos destino
+        file_paths: Rutas de los archivos, en orden de prioridad
+        policy: Política de duplicados (ver DEDUPE_POLICIES)
+        chunk_size: Cantidad de productos por lote (una transacción cada uno)
+        progress: Callback con un resumen (processed, imported, updated,
+            errors, fraction); la lectura ocupa la primera mitad del avance
+        cancel: Función consultada entre archivos y antes de cada lote
+        max_workers: Procesos a usar (por defecto uno por archivo, hasta la
+            cantidad de núcleos)
+
+    Returns:
+        Diccionario con estadísticas de importación, más 'duplicates'
+    """
+    if policy not in DEDUPE_POLICIES:
+        raise ValueError(f"Política de duplicados inválida: {policy}")
+
+    stats = new_import_stats()
+    stats['duplicates'] = 0
+    parsed: List[Optional[Dict]] = [None] * len(file_paths)
+
+    def report(processed, fraction):
+        if progress:
+            progress({
+                'processed': processed,
+                'imported': stats['imported'],
+                'updated': stats['updated'],
+                'errors': len(stats['errors']),
+                'fraction': fraction
+            })
+
+    # Lectura y validación en paralelo
+    workers = max_workers or min(len(file_paths), os.cpu_count() or 1) or 1
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            pool.submit(parse_csv_file, path): index
+            for index, path in enumerate(file_paths)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            parsed[futures[future]] = result
+            stats['total'] += result['total']
+            stats['errors'].extend(result['errors'])
+            report(stats['total'], 0.5 * done / len(file_paths))
+
+            if cancel and cancel():
+                for pending in futures:
+                    pending.cancel()
+                stats['cancelled'] = True
+                return stats
+    finally:
+        # Al cancelar no se espera a los archivos que se están leyendo
+        # (with esperaría); sus resultados se descartan
+        pool.shutdown(wait=not stats['cancelled'])
+
+    merged, stats['duplicates'] = merge_parsed_files(parsed, policy)
+    rows = len(merged)
+
+    def report_written(current):
+        written = current['imported'] + current['updated']
+        report(written, 0.5 + 0.5 * written / rows if rows else 1.0)
+
+    # Un solo escritor para el flujo combinado
+    return db.import_rows(
+        merged.values(),
+        chunk_size,
+        progress=report_written if progress else None,
+        cancel=cancel,
+        stats=stats
+    )
@@ -3,22 +3,70 @@ Oaky Desktop - Sistema de Gestión de Precios y Stock
 Aplicación de escritorio para tienda de ropa usando Tkinter
 """
 
+import time
+# Se toma antes de importar tkinter para que el informe de arranque lo incluya
+STARTED_AT = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import csv
-from database import Database
+from tkinter import ttk, messagebox, filedialog, simpledialog
+import sqlite3
+import sys
+from database import Database, STOCK_REASON_ADJUSTMENT, STOCK_REASON_RESTOCK
+from workers import SearchScheduler, BackgroundTask
+from product_table import VirtualProductTable
+from scanner import ScanDetector
+from startup import StartupTimer
+# catalog, importer y exporter se importan al usarse: no hacen falta para
+# mostrar la primera ventana (importer carga multiprocessing)
 
 
 class OakyDesktopApp:
     """Aplicación principal"""
     
-    def __init__(self, root):
+    def __init__(self, root, use_snapshot=False, startup=None, startup_report=False):
+        """
+        Args:
+            root: Ventana raíz de Tkinter
+            use_snapshot: Filtrar y calcular estadísticas sobre una copia
+                del catálogo en memoria (CatalogSnapshot) en lugar de SQLite.
+                Se carga en segundo plano después de mostrar la ventana.
+            startup: StartupTimer con las etapas previas del arranque
+            startup_report: Imprimir en stderr el informe de arranque
+                cuando se dibuja la primera ventana
+        """
+        self.startup = startup or StartupTimer()
+        self.startup_report = startup_report
+        
         self.root = root
         self.root.title("🛍️ Oaky Desktop - Gestión de Precios y Stock")
         self.root.geometry("1400x900")
         
         # Base de datos
         self.db = Database()
+        self.low_stock_threshold = self.db.get_low_stock_threshold()
+        self.startup.mark("base de datos")
+        
+        # Catálogo en memoria (opcional, se carga después del primer cuadro)
+        self.catalog = None
+        self.use_snapshot = use_snapshot
+        self.catalog_task = None
+        
+        # Búsqueda con debounce en segundo plano
+        self.search_scheduler = SearchScheduler(
+            self.root,
+            self.db.db_path,
+            self.show_products,
+            query=self.query_products
+        )
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Tareas en segundo plano
+        self.import_task = None
+        self.export_task = None
+        
+        # Escáner de códigos de barras (ráfagas de teclas + Enter)
+        self.scanner = ScanDetector()
+        self._scanning = False
         
         # Variables
         self.search_var = tk.StringVar()
@@ -26,10 +74,65 @@ class OakyDesktopApp:
         
         # Crear interfaz
         self.create_widgets()
+        self.startup.mark("interfaz")
         
-        # Cargar productos
+        # Primer cuadro: solo la primera página y las estadísticas guardadas
         self.load_products()
         self.update_stats()
+        self.startup.mark("primera página")
+        
+        self.root.bind('<Map>', self.on_first_map)
+    
+    def on_first_map(self, event):
+        """Espera a que la ventana principal quede visible"""
+        if event.widget is not self.root:
+            return
+        self.root.unbind('<Map>')
+        # Los redibujos pendientes se procesan antes que este callback
+        self.root.after_idle(self.on_first_frame)
+    
+    def on_first_frame(self):
+        """Cierra la medición del arranque y lanza el trabajo diferido"""
+        self.startup.mark("primer cuadro")
+        if self.startup_report:
+            print(self.startup.format(), file=sys.stderr)
+        
+        if self.use_snapshot:
+            self.load_catalog_snapshot()
+    
+    def load_catalog_snapshot(self):
+        """
+        Carga el catálogo en memoria en segundo plano; mientras tanto las
+        búsquedas y estadísticas se resuelven con SQLite
+        """
+        from catalog import CatalogSnapshot
+        
+        snapshot = CatalogSnapshot(self.db)
+        # reload lee con la conexión de lectura del hilo de la tarea
+        self.catalog_task = BackgroundTask(
+            self.root,
+            self.db.db_path,
+            lambda db, progress, cancelled: snapshot.reload(),
+            on_done=lambda _result: self.on_catalog_loaded(snapshot),
+            on_error=self.on_catalog_error
+        )
+        self.catalog_task.start()
+    
+    def on_catalog_loaded(self, snapshot):
+        """Empieza a usar el catálogo en memoria ya cargado"""
+        self.catalog_task = None
+        # Cambios hechos mientras se cargaba
+        snapshot.sync()
+        self.catalog = snapshot
+        self.update_stats()
+    
+    def on_catalog_error(self, error):
+        """Sigue con SQLite si no se pudo cargar el catálogo en memoria"""
+        self.catalog_task = None
+        messagebox.showwarning(
+            "Aviso",
+            f"No se pudo cargar el catálogo en memoria, se usa la base de datos:\n{str(error)}"
+        )
     
     def create_widgets(self):
         """Crea todos los widgets de la interfaz"""
@@ -64,10 +167,32 @@ class OakyDesktopApp:
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # Pestañas
+        # Pestañas: la de búsqueda se arma ya; las demás la primera vez
+        # que se seleccionan
+        self.lazy_tabs = {}
         self.create_search_tab()
-        self.create_bulk_tab()
-        self.create_import_tab()
+        self.add_lazy_tab("💰 Actualización Masiva", self.create_bulk_tab)
+        self.add_lazy_tab("📁 Importar/Exportar", self.create_import_tab)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+    
+    def add_lazy_tab(self, text, builder):
+        """
+        Agrega una pestaña vacía cuyo contenido se crea al seleccionarla
+        
+        Args:
+            text: Título de la pestaña
+            builder: Función que recibe el frame de la pestaña y la arma
+        """
+        tab = ttk.Frame(self.notebook)
+        self.notebook.add(tab, text=text)
+        self.lazy_tabs[str(tab)] = (tab, builder)
+    
+    def on_tab_changed(self, event):
+        """Arma la pestaña seleccionada si todavía no se creó"""
+        pending = self.lazy_tabs.pop(self.notebook.select(), None)
+        if pending:
+            tab, builder = pending
+            builder(tab)
     
     def create_stats_panel(self):
         """Crea el panel de estadísticas"""
@@ -135,6 +260,7 @@ class OakyDesktopApp:
         search_entry.pack(side='left', fill='x', expand=True, padx=(0, 10))
         search_entry.insert(0, "🔍 Buscar por código de barras o nombre...")
         search_entry.bind('<FocusIn>', lambda e: search_entry.delete(0, 'end') if search_entry.get().startswith('🔍') else None)
+        search_entry.bind('<KeyPress>', self.on_scan_key)
         
         new_btn = tk.Button(
             search_frame,
@@ -150,53 +276,69 @@ class OakyDesktopApp:
         )
         new_btn.pack(side='left')
         
-        # Tabla de productos
-        table_frame = tk.Frame(tab)
-        table_frame.pack(fill='both', expand=True, padx=10, pady=10)
-        
-        # Scrollbars
-        y_scroll = ttk.Scrollbar(table_frame)
-        y_scroll.pack(side='right', fill='y')
+        # Filtro y umbral de stock bajo
+        filter_frame = tk.Frame(tab)
+        filter_frame.pack(fill='x', padx=10)
         
-        x_scroll = ttk.Scrollbar(table_frame, orient='horizontal')
-        x_scroll.pack(side='bottom', fill='x')
+        self.low_stock_only_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            filter_frame,
+            text="⚠️ Ver solo productos con stock bajo",
+            variable=self.low_stock_only_var,
+            command=self.on_low_stock_filter,
+            font=('Arial', 10)
+        ).pack(side='left')
         
-        # Treeview (tabla)
-        self.tree = ttk.Treeview(
-            table_frame,
-            columns=('Código', 'Nombre', 'Precio', 'Stock', 'Estado'),
-            show='headings',
-            yscrollcommand=y_scroll.set,
-            xscrollcommand=x_scroll.set
+        tk.Label(
+            filter_frame,
+            text="Umbral de stock bajo:",
+            font=('Arial', 10)
+        ).pack(side='left', padx=(20, 5))
+        
+        self.threshold_var = tk.StringVar(value=str(self.low_stock_threshold))
+        threshold_spin = tk.Spinbox(
+            filter_frame,
+            from_=0,
+            to=100000,
+            textvariable=self.threshold_var,
+            command=self.apply_low_stock_threshold,
+            font=('Arial', 10),
+            width=6
         )
+        threshold_spin.pack(side='left')
+        threshold_spin.bind('<Return>', lambda e: self.apply_low_stock_threshold())
+        
+        self.scan_opens_dialog_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            filter_frame,
+            text="📷 Abrir ficha al escanear",
+            variable=self.scan_opens_dialog_var,
+            font=('Arial', 10)
+        ).pack(side='left', padx=(20, 0))
+        
+        self.scan_status_var = tk.StringVar(value="")
+        tk.Label(
+            filter_frame,
+            textvariable=self.scan_status_var,
+            font=('Arial', 10, 'bold'),
+            fg='#2563eb'
+        ).pack(side='right')
         
-        y_scroll.config(command=self.tree.yview)
-        x_scroll.config(command=self.tree.xview)
-        
-        # Configurar columnas
-        self.tree.heading('Código', text='Código de Barras')
-        self.tree.heading('Nombre', text='Nombre del Producto')
-        self.tree.heading('Precio', text='Precio')
-        self.tree.heading('Stock', text='Stock')
-        self.tree.heading('Estado', text='Estado')
-        
-        self.tree.column('Código', width=150)
-        self.tree.column('Nombre', width=400)
-        self.tree.column('Precio', width=120)
-        self.tree.column('Stock', width=80)
-        self.tree.column('Estado', width=120)
-        
-        self.tree.pack(fill='both', expand=True)
+        # Tabla de productos (virtual: solo filas visibles)
+        self.product_table = VirtualProductTable(tab)
+        self.product_table.low_stock_threshold = self.low_stock_threshold
+        self.product_table.pack(fill='both', expand=True, padx=10, pady=10)
+        self.tree = self.product_table.tree
         
         # Menú contextual
         self.tree.bind('<Double-Button-1>', self.edit_product_from_tree)
         self.tree.bind('<Button-3>', self.show_context_menu)
-    
-    def create_bulk_tab(self):
-        """Crea la pestaña de actualización masiva"""
-        tab = ttk.Frame(self.notebook)
-        self.notebook.add(tab, text="💰 Actualización Masiva")
         
+        # El escáner también funciona con el foco en la tabla
+        self.tree.bind('<KeyPress>', self.on_scan_key)
+    
+    def create_bulk_tab(self, tab):
+        """Crea el contenido de la pestaña de actualización masiva"""
         # Frame principal
         main_frame = tk.Frame(tab)
         main_frame.pack(fill='both', expand=True, padx=50, pady=50)
@@ -244,10 +386,58 @@ class OakyDesktopApp:
             font=('Arial', 14)
         ).pack(side='left', padx=5)
         
-        # Botón aplicar
+        # Filtros (vacíos = todos los productos)
+        filter_frame = tk.Frame(main_frame)
+        filter_frame.pack(pady=10)
+        
+        tk.Label(
+            filter_frame,
+            text="Nombre contiene:",
+            font=('Arial', 11)
+        ).grid(row=0, column=0, sticky='w', padx=10, pady=5)
+        
+        self.bulk_name_var = tk.StringVar()
+        tk.Entry(
+            filter_frame,
+            textvariable=self.bulk_name_var,
+            font=('Arial', 11),
+            width=25
+        ).grid(row=0, column=1, pady=5)
+        
+        tk.Label(
+            filter_frame,
+            text="Código empieza con:",
+            font=('Arial', 11)
+        ).grid(row=1, column=0, sticky='w', padx=10, pady=5)
+        
+        self.bulk_prefix_var = tk.StringVar()
+        tk.Entry(
+            filter_frame,
+            textvariable=self.bulk_prefix_var,
+            font=('Arial', 11),
+            width=25
+        ).grid(row=1, column=1, pady=5)
+        
+        # Botones
+        buttons_frame = tk.Frame(main_frame)
+        buttons_frame.pack(pady=20)
+        
+        tk.Button(
+            buttons_frame,
+            text="🔎 Vista Previa",
+            command=self.preview_bulk_price_update,
+            bg='#2563eb',
+            fg='white',
+            font=('Arial', 12, 'bold'),
+            padx=20,
+            pady=15,
+            relief='flat',
+            cursor='hand2'
+        ).pack(side='left', padx=5)
+        
         apply_btn = tk.Button(
-            main_frame,
-            text="📊 Aplicar Cambios a TODOS los Productos",
+            buttons_frame,
+            text="📊 Aplicar Cambios",
             command=self.apply_bulk_price_update,
             bg='#10b981',
             fg='white',
@@ -257,7 +447,29 @@ class OakyDesktopApp:
             relief='flat',
             cursor='hand2'
         )
-        apply_btn.pack(pady=30)
+        apply_btn.pack(side='left', padx=5)
+        
+        tk.Button(
+            buttons_frame,
+            text="↩️ Deshacer Último Cambio",
+            command=self.undo_bulk_price_update,
+            bg='#64748b',
+            fg='white',
+            font=('Arial', 12, 'bold'),
+            padx=20,
+            pady=15,
+            relief='flat',
+            cursor='hand2'
+        ).pack(side='left', padx=5)
+        
+        # Resultado de la vista previa
+        self.bulk_preview_var = tk.StringVar(value="")
+        tk.Label(
+            main_frame,
+            textvariable=self.bulk_preview_var,
+            font=('Arial', 11),
+            justify='left'
+        ).pack(pady=10)
         
         # Ejemplo
         example = tk.Label(
@@ -271,11 +483,8 @@ class OakyDesktopApp:
         )
         example.pack(pady=10)
     
-    def create_import_tab(self):
-        """Crea la pestaña de importar/exportar"""
-        tab = ttk.Frame(self.notebook)
-        self.notebook.add(tab, text="📁 Importar/Exportar")
-        
+    def create_import_tab(self, tab):
+        """Crea el contenido de la pestaña de importar/exportar"""
         main_frame = tk.Frame(tab)
         main_frame.pack(fill='both', expand=True, padx=50, pady=30)
         
@@ -289,15 +498,16 @@ class OakyDesktopApp:
         
         import_info = tk.Label(
             main_frame,
-            text="Importa productos desde un archivo CSV.\n"
-                 "El archivo debe tener las columnas: barcode,name,price,stock",
+            text="Importa productos desde uno o varios archivos CSV.\n"
+                 "El archivo debe tener las columnas: barcode,name,price,stock\n"
+                 "Si un código se repite entre archivos, gana el último seleccionado.",
             font=('Arial', 10),
             fg='#64748b',
             justify='left'
         )
         import_info.pack(anchor='w', pady=(0, 10))
         
-        import_btn = tk.Button(
+        self.import_btn = tk.Button(
             main_frame,
             text="📁 Seleccionar Archivo CSV",
             command=self.import_csv,
@@ -309,7 +519,12 @@ class OakyDesktopApp:
             relief='flat',
             cursor='hand2'
         )
-        import_btn.pack(anchor='w', pady=(0, 30))
+        self.import_btn.pack(anchor='w', pady=(0, 10))
+        
+        # Progreso de la importación
+        (self.import_progress,
+         self.import_status_var,
+         self.import_cancel_btn) = self.create_progress_row(main_frame, self.cancel_import)
         
         # Separador
         ttk.Separator(main_frame, orient='horizontal').pack(fill='x', pady=20)
@@ -332,7 +547,7 @@ class OakyDesktopApp:
         )
         export_info.pack(anchor='w', pady=(0, 10))
         
-        export_btn = tk.Button(
+        self.export_btn = tk.Button(
             main_frame,
             text="💾 Exportar a CSV",
             command=self.export_csv,
@@ -344,7 +559,12 @@ class OakyDesktopApp:
             relief='flat',
             cursor='hand2'
         )
-        export_btn.pack(anchor='w', pady=(0, 30))
+        self.export_btn.pack(anchor='w', pady=(0, 10))
+        
+        # Progreso de la exportación
+        (self.export_progress,
+         self.export_status_var,
+         self.export_cancel_btn) = self.create_progress_row(main_frame, self.cancel_export)
         
         # Ejemplo CSV
         ttk.Separator(main_frame, orient='horizontal').pack(fill='x', pady=20)
@@ -373,65 +593,250 @@ class OakyDesktopApp:
         )
         example_text.config(state='disabled')
     
-    def load_products(self, search_term=""):
-        """Carga productos en la tabla"""
-        # Limpiar tabla
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    def query_products(self, db, search_term):
+        """
+        Obtiene el total, la primera página y la función para pedir más
+        páginas de una búsqueda.
+        Puede ejecutarse en el hilo de búsqueda con su propia conexión.
+        """
+        if self.catalog is not None:
+            positions = self.catalog.search(search_term)
+            fetch = lambda offset, limit: self.catalog.rows(positions, offset, limit)
+            return len(positions), fetch(0, self.product_table.page_size), fetch
+        
+        # Sin filtro el total sale de las estadísticas guardadas (sin COUNT)
+        if search_term:
+            total = db.count_products(search_term)
+        else:
+            total = db.get_stats()['total_products']
+        rows = db.search_products(search_term, limit=self.product_table.page_size)
+        # Las páginas siguientes se piden desde el hilo de Tk
+        fetch = lambda offset, limit: self.db.search_products(search_term, limit=limit, offset=offset)
+        return total, rows, fetch
+    
+    def create_progress_row(self, parent, cancel_command):
+        """
+        Crea una etiqueta de estado, una barra de progreso y un botón de
+        cancelar para una tarea en segundo plano
+        
+        Returns:
+            Tupla (barra de progreso, variable de estado, botón cancelar)
+        """
+        status_var = tk.StringVar(value="")
+        tk.Label(
+            parent,
+            textvariable=status_var,
+            font=('Arial', 10),
+            fg='#64748b'
+        ).pack(anchor='w')
         
-        # Obtener productos
-        products = self.db.search_products(search_term)
+        progress_frame = tk.Frame(parent)
+        progress_frame.pack(fill='x', pady=(0, 30))
         
-        # Agregar a tabla
-        for product in products:
-            stock = product['stock']
-            
-            # Determinar estado
-            if stock == 0:
-                estado = "🔴 Sin Stock"
-                tag = 'red'
-            elif stock < 5:
-                estado = "🟡 Stock Bajo"
-                tag = 'yellow'
-            else:
-                estado = "🟢 En Stock"
-                tag = 'green'
-            
-            self.tree.insert(
-                '',
-                'end',
-                values=(
-                    product['barcode'],
-                    product['name'],
-                    f"${product['price']:,.2f}",
-                    stock,
-                    estado
-                ),
-                tags=(tag,)
-            )
+        progress = ttk.Progressbar(
+            progress_frame,
+            orient='horizontal',
+            mode='determinate',
+            maximum=100
+        )
+        progress.pack(side='left', fill='x', expand=True, padx=(0, 10))
+        
+        cancel_btn = tk.Button(
+            progress_frame,
+            text="⛔ Cancelar",
+            command=cancel_command,
+            bg='#64748b',
+            fg='white',
+            font=('Arial', 10, 'bold'),
+            padx=15,
+            relief='flat',
+            cursor='hand2',
+            state='disabled'
+        )
+        cancel_btn.pack(side='left')
         
-        # Configurar colores
-        self.tree.tag_configure('red', background='#fee2e2')
-        self.tree.tag_configure('yellow', background='#fef3c7')
-        self.tree.tag_configure('green', background='#d1fae5')
+        return progress, status_var, cancel_btn
+    
+    def load_products(self, search_term=""):
+        """Carga productos en la tabla"""
+        self.show_products(self.query_products(self.db, search_term))
+    
+    def show_products(self, result):
+        """Muestra en la tabla el resultado de query_products"""
+        total, rows, fetch = result
+        self.product_table.set_source(total, fetch, rows)
     
     def update_stats(self):
         """Actualiza las estadísticas"""
-        stats = self.db.get_stats()
+        if self.catalog is not None:
+            self.stats = self.catalog.stats(self.low_stock_threshold)
+        else:
+            self.stats = self.db.get_stats()
+        self.show_stats()
+    
+    def show_stats(self):
+        """Muestra en el panel las estadísticas actuales"""
+        stats = self.stats
         self.stat_products.set(f"{stats['total_products']:,}")
         self.stat_value.set(f"${stats['total_value']:,.2f}")
         self.stat_stock.set(f"{stats['total_stock']:,}")
         self.stat_low.set(f"{stats['low_stock']:,}")
     
+    def adjust_stats(self, old, new):
+        """
+        Ajusta las estadísticas con el cambio de un solo producto,
+        sin volver a recorrer la tabla
+        
+        Args:
+            old: Producto antes del cambio (None si es nuevo)
+            new: Producto después del cambio (None si se eliminó)
+        """
+        stats = self.stats
+        for product, sign in ((old, -1), (new, 1)):
+            if product is None:
+                continue
+            stats['total_products'] += sign
+            stats['total_value'] += sign * product['price'] * product['stock']
+            stats['total_stock'] += sign * product['stock']
+            if product['stock'] < self.low_stock_threshold:
+                stats['low_stock'] += sign
+        
+        stats['total_value'] = round(stats['total_value'], 2)
+        self.show_stats()
+    
+    def apply_product_change(self, old, new):
+        """
+        Refleja en la tabla y en las estadísticas el cambio de un producto
+        (alta, edición o baja) sin recargar todo
+        
+        Args:
+            old: Producto antes del cambio (None si es nuevo)
+            new: Producto después del cambio (None si se eliminó)
+        """
+        if self.catalog is not None:
+            self.catalog.apply_delta(old, new)
+        self.product_table.apply_delta(old, new)
+        self.adjust_stats(old, new)
+    
     def on_search(self, *args):
         """Maneja la búsqueda"""
+        if self._scanning:
+            return
         search_text = self.search_var.get()
         if not search_text.startswith('🔍'):
-            self.load_products(search_text)
+            self.low_stock_only_var.set(False)
+            self.search_scheduler.schedule(search_text)
+    
+    def on_scan_key(self, event):
+        """
+        Pasa cada tecla al detector de escáner. Un Enter al final de una
+        ráfaga se resuelve como código de barras, sin búsqueda por subcadena.
+        """
+        if event.keysym in ('Return', 'KP_Enter'):
+            code = self.scanner.finish(event.time)
+            if code is None:
+                return None
+            self.on_scan(code)
+            return 'break'
+        
+        if len(event.char) == 1 and event.char.isprintable():
+            self.scanner.feed(event.char, event.time)
+        return None
+    
+    def on_scan(self, code):
+        """
+        Muestra el producto de un código escaneado
+        
+        Se resuelve con una búsqueda exacta (caché de códigos de barras o el
+        índice único de barcode) y se descarta la búsqueda por texto que
+        hubieran programado las teclas de la ráfaga.
+        """
+        self.search_scheduler.cancel()
+        
+        start = time.perf_counter()
+        product = self.db.get_product_by_barcode(code)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        # Dejar en el buscador solo el código, sin disparar otra búsqueda
+        self._scanning = True
+        try:
+            self.search_var.set(code)
+        finally:
+            self._scanning = False
+        
+        if product is None:
+            self.scan_status_var.set(f"📷 {code}: producto no encontrado")
+            self.root.bell()
+            return
+        
+        self.scan_status_var.set(
+            f"📷 {product['name']} - ${product['price']:,.2f} ({elapsed_ms:.2f} ms)"
+        )
+        
+        def fetch(offset, limit):
+            current = self.db.get_product_by_barcode(code)
+            return ([current] if current else [])[offset:offset + limit]
+        
+        self.low_stock_only_var.set(False)
+        self.product_table.set_source(1, fetch, [product])
+        self.tree.selection_set(product['barcode'])
+        self.tree.focus(product['barcode'])
+        
+        if self.scan_opens_dialog_var.get():
+            ProductDialog(self.root, self.db, self.apply_product_change, product)
+    
+    def current_search_term(self):
+        """Término de búsqueda actual (sin el texto de ayuda)"""
+        search_text = self.search_var.get()
+        return "" if search_text.startswith('🔍') else search_text
+    
+    def show_low_stock(self):
+        """Muestra en la tabla el reporte de productos con stock bajo"""
+        if self.catalog is not None:
+            positions = self.catalog.low_stock(self.low_stock_threshold)
+            self.product_table.set_source(
+                len(positions),
+                lambda offset, limit: self.catalog.rows(positions, offset, limit)
+            )
+            return
+        
+        self.product_table.set_source(
+            self.stats['low_stock'],
+            lambda offset, limit: self.db.get_low_stock_products(limit=limit, offset=offset)
+        )
+    
+    def on_low_stock_filter(self):
+        """Alterna entre el reporte de stock bajo y la búsqueda"""
+        if self.low_stock_only_var.get():
+            self.show_low_stock()
+        else:
+            self.load_products(self.current_search_term())
+    
+    def apply_low_stock_threshold(self):
+        """Guarda el umbral de stock bajo y actualiza la vista"""
+        try:
+            threshold = int(self.threshold_var.get())
+        except ValueError:
+            messagebox.showerror("Error", "El umbral debe ser un número entero")
+            return
+        
+        success, msg = self.db.set_low_stock_threshold(threshold)
+        if not success:
+            messagebox.showerror("Error", msg)
+            return
+        
+        self.low_stock_threshold = threshold
+        self.product_table.low_stock_threshold = threshold
+        self.update_stats()
+        
+        if self.low_stock_only_var.get():
+            self.show_low_stock()
+        else:
+            self.product_table.refresh()
     
     def create_product(self):
         """Abre ventana para crear producto"""
-        ProductDialog(self.root, self.db, self.refresh_data)
+        ProductDialog(self.root, self.db, self.apply_product_change)
     
     def edit_product_from_tree(self, event):
         """Edita el producto seleccionado"""
@@ -439,12 +844,11 @@ class OakyDesktopApp:
         if not selection:
             return
         
-        item = self.tree.item(selection[0])
-        barcode = item['values'][0]
+        barcode = selection[0]  # el iid de cada fila es su código de barras
         
         product = self.db.get_product(barcode)
         if product:
-            ProductDialog(self.root, self.db, self.refresh_data, product)
+            ProductDialog(self.root, self.db, self.apply_product_change, product)
     
     def show_context_menu(self, event):
         """Muestra menú contextual"""
@@ -454,86 +858,316 @@ class OakyDesktopApp:
         
         menu = tk.Menu(self.root, tearoff=0)
         menu.add_command(label="✏️ Editar", command=lambda: self.edit_product_from_tree(event))
+        menu.add_command(label="📦 Cambiar stock...", command=self.set_selected_stock)
+        menu.add_command(label="➕ Sumar/restar stock...", command=self.adjust_selected_stock)
+        menu.add_command(label="📈 Historial de precios", command=self.show_price_history)
         menu.add_command(label="🗑️ Eliminar", command=self.delete_selected_product)
         
         menu.post(event.x_root, event.y_root)
     
-    def delete_selected_product(self):
-        """Elimina el producto seleccionado"""
+    def show_price_history(self):
+        """Muestra los últimos cambios de precio del producto seleccionado"""
         selection = self.tree.selection()
         if not selection:
             return
         
-        item = self.tree.item(selection[0])
-        barcode = item['values'][0]
+        product = self.db.get_product(selection[0])
+        if not product:
+            return
         
-        if messagebox.askyesno("Confirmar", "¿Estás seguro de eliminar este producto?"):
-            if self.db.delete_product(barcode):
-                messagebox.showinfo("Éxito", "Producto eliminado exitosamente")
-                self.refresh_data()
+        history = self.db.get_price_history(product['id'], limit=15)
+        since = self.db.current_timestamp(days_ago=90)
+        price_before = self.db.get_price_at(product['id'], since)
+        
+        lines = [f"{product['name']} ({product['barcode']})", ""]
+        if price_before:
+            change = (product['price'] - price_before) * 100 / price_before
+            lines.append(f"Últimos 90 días: ${price_before:,.2f} → ${product['price']:,.2f} ({change:+.1f}%)")
+            lines.append("")
+        
+        for entry in history:
+            if entry['old_price'] is None:
+                lines.append(f"{entry['changed_at']}  alta a ${entry['new_price']:,.2f}")
             else:
-                messagebox.showerror("Error", "No se pudo eliminar el producto")
+                lines.append(
+                    f"{entry['changed_at']}  ${entry['old_price']:,.2f} → ${entry['new_price']:,.2f}"
+                )
+        
+        messagebox.showinfo("Historial de precios", "\n".join(lines))
     
-    def apply_bulk_price_update(self):
-        """Aplica actualización masiva de precios"""
+    def delete_selected_product(self):
+        """Elimina los productos seleccionados (una sola llamada a la base)"""
+        barcodes = self.product_table.selected_barcodes()
+        if not barcodes:
+            return
+        
+        if len(barcodes) == 1:
+            question = "¿Estás seguro de eliminar este producto?"
+        else:
+            question = f"¿Estás seguro de eliminar {len(barcodes)} productos?"
+        if not messagebox.askyesno("Confirmar", question):
+            return
+        
+        products = self.db.get_products_by_barcodes(barcodes)
+        results = self.db.delete_products(barcodes)
+        deleted = [
+            barcode for barcode, (success, _msg) in zip(barcodes, results)
+            if success and barcode in products
+        ]
+        for barcode in deleted:
+            self.apply_product_change(products[barcode], None)
+        
+        if len(deleted) == 1 and len(barcodes) == 1:
+            messagebox.showinfo("Éxito", "Producto eliminado exitosamente")
+        elif len(deleted) == len(barcodes):
+            messagebox.showinfo("Éxito", f"{len(deleted)} productos eliminados exitosamente")
+        elif deleted:
+            messagebox.showwarning("Atención", f"Se eliminaron {len(deleted)} de {len(barcodes)} productos")
+        else:
+            messagebox.showerror("Error", "No se pudo eliminar el producto")
+    
+    def set_selected_stock(self):
+        """Fija el mismo stock a todos los productos seleccionados"""
+        barcodes = self.product_table.selected_barcodes()
+        if not barcodes:
+            return
+        
+        stock = simpledialog.askinteger(
+            "Cambiar stock",
+            f"Nuevo stock para {len(barcodes)} producto(s):",
+            minvalue=0,
+            parent=self.root
+        )
+        if stock is None:
+            return
+        
+        before = self.db.get_products_by_barcodes(barcodes)
+        results = self.db.update_products({'barcode': barcode, 'stock': stock} for barcode in barcodes)
+        updated = [barcode for barcode, (success, _msg) in zip(barcodes, results) if success]
+        after = self.db.get_products_by_barcodes(updated)
+        
+        for barcode in updated:
+            if barcode in before and barcode in after:
+                self.apply_product_change(before[barcode], after[barcode])
+        
+        if len(updated) != len(barcodes):
+            messagebox.showerror("Error", f"No se pudo actualizar {len(barcodes) - len(updated)} producto(s)")
+    
+    def adjust_selected_stock(self):
+        """Suma o resta unidades al stock de los productos seleccionados"""
+        barcodes = self.product_table.selected_barcodes()
+        if not barcodes:
+            return
+        
+        delta = simpledialog.askinteger(
+            "Sumar/restar stock",
+            f"Unidades a sumar a {len(barcodes)} producto(s) (negativo para restar):",
+            parent=self.root
+        )
+        if not delta:
+            return
+        
+        reason = STOCK_REASON_RESTOCK if delta > 0 else STOCK_REASON_ADJUSTMENT
+        before = self.db.get_products_by_barcodes(barcodes)
+        results = self.db.adjust_stock_batch(((barcode, delta) for barcode in barcodes), reason)
+        updated = [barcode for barcode, (success, _msg, _stock) in zip(barcodes, results) if success]
+        after = self.db.get_products_by_barcodes(updated)
+        
+        for barcode in updated:
+            if barcode in before and barcode in after:
+                self.apply_product_change(before[barcode], after[barcode])
+        
+        failed = [msg for success, msg, _stock in results if not success]
+        if failed:
+            messagebox.showerror("Error", "\n".join(failed[:10]))
+    
+    def get_bulk_percentage(self):
+        """Porcentaje ingresado en la pestaña masiva (None si no es válido)"""
         try:
             percentage = float(self.percentage_var.get())
         except ValueError:
             messagebox.showerror("Error", "Ingresa un porcentaje válido")
-            return
+            return None
         
         if percentage == 0:
             messagebox.showerror("Error", "El porcentaje no puede ser 0")
+            return None
+        
+        if percentage <= -100:
+            messagebox.showerror("Error", "El descuento debe ser menor al 100%")
+            return None
+        
+        return percentage
+    
+    def get_bulk_filters(self):
+        """Filtros de la pestaña masiva, listos para pasar a la base de datos"""
+        return {
+            'name_pattern': self.bulk_name_var.get().strip() or None,
+            'barcode_prefix': self.bulk_prefix_var.get().strip() or None
+        }
+    
+    def format_price_preview(self, preview):
+        """Texto con el resumen de un cambio masivo de precios"""
+        if not preview['products']:
+            return "Ningún producto coincide con el filtro"
+        
+        return (
+            f"Productos alcanzados: {preview['products']:,} "
+            f"(cambian de precio: {preview['changed']:,})\n"
+            f"Precio promedio: ${preview['avg_before']:,.2f} → ${preview['avg_after']:,.2f}\n"
+            f"Rango: ${preview['min_before']:,.2f} - ${preview['max_before']:,.2f} → "
+            f"${preview['min_after']:,.2f} - ${preview['max_after']:,.2f}\n"
+            f"Valor del stock: ${preview['value_before']:,.2f} → ${preview['value_after']:,.2f}"
+        )
+    
+    def preview_bulk_price_update(self):
+        """Muestra el efecto del cambio masivo sin aplicarlo"""
+        percentage = self.get_bulk_percentage()
+        if percentage is None:
+            return
+        
+        preview = self.db.preview_price_update(percentage, **self.get_bulk_filters())
+        self.bulk_preview_var.set(self.format_price_preview(preview))
+    
+    def apply_bulk_price_update(self):
+        """Aplica actualización masiva de precios"""
+        percentage = self.get_bulk_percentage()
+        if percentage is None:
+            return
+        
+        filters = self.get_bulk_filters()
+        preview = self.db.preview_price_update(percentage, **filters)
+        self.bulk_preview_var.set(self.format_price_preview(preview))
+        
+        if not preview['changed']:
+            messagebox.showinfo("Sin cambios", "Ningún precio cambia con ese porcentaje y filtro")
             return
         
         action = "aumentar" if percentage > 0 else "reducir"
-        products = self.db.get_all_products()
         
         if messagebox.askyesno(
             "Confirmar",
-            f"¿Estás seguro de {action} el precio de {len(products)} productos en {abs(percentage)}%?"
+            f"¿Estás seguro de {action} el precio de {preview['changed']:,} productos "
+            f"en {abs(percentage)}%?\n\n{self.format_price_preview(preview)}"
         ):
-            if self.db.update_prices_bulk(percentage):
-                messagebox.showinfo("Éxito", "Precios actualizados exitosamente")
+            success, message = self.db.update_prices_bulk(percentage, **filters)
+            if success:
+                messagebox.showinfo("Éxito", f"Precios actualizados: {message}")
                 self.refresh_data()
             else:
-                messagebox.showerror("Error", "No se pudieron actualizar los precios")
+                messagebox.showerror("Error", f"No se pudieron actualizar los precios\n{message}")
+    
+    def undo_bulk_price_update(self):
+        """Deshace el último cambio masivo de precios"""
+        batches = [batch for batch in self.db.get_price_batches() if batch['reverted_at'] is None]
+        if not batches:
+            messagebox.showinfo("Deshacer", "No hay cambios de precios para deshacer")
+            return
+        
+        batch = batches[0]
+        if not messagebox.askyesno(
+            "Confirmar",
+            f"¿Deshacer el cambio de {batch['percentage']:+g}% del {batch['created_at']} "
+            f"({batch['description']}, {batch['product_count']:,} productos)?"
+        ):
+            return
+        
+        success, message = self.db.revert_price_batch(batch['id'])
+        if success:
+            messagebox.showinfo("Éxito", message)
+            self.refresh_data()
+        else:
+            messagebox.showerror("Error", message)
     
     def import_csv(self):
         """Importa productos desde CSV"""
-        file_path = filedialog.askopenfilename(
-            title="Seleccionar archivo CSV",
+        file_paths = filedialog.askopenfilenames(
+            title="Seleccionar archivo(s) CSV",
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
         )
         
-        if not file_path:
+        if not file_paths:
             return
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                products_data = []
-                
-                for row in reader:
-                    if 'price' in row:
-                        row['price'] = row['price'].strip().replace(' ', '')
-                    products_data.append(row)
-            
-            result = self.db.import_from_csv_data(products_data)
-            
-            msg = f"Importación completada:\n\n"
-            msg += f"✅ Nuevos productos: {result['imported']}\n"
-            msg += f"🔄 Productos actualizados: {result['updated']}\n"
-            msg += f"📊 Total procesados: {result['total']}\n"
-            
-            if result['errors']:
-                msg += f"\n⚠️ Errores: {len(result['errors'])}"
-            
-            messagebox.showinfo("Importación Completada", msg)
-            self.refresh_data()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al importar archivo:\n{str(e)}")
+        from importer import import_csv_file, import_csv_files
+        
+        if len(file_paths) == 1:
+            # Un archivo: lectura en streaming
+            task = lambda db, progress, cancelled: import_csv_file(
+                db, file_paths[0], progress=progress, cancel=cancelled
+            )
+        else:
+            # Varios archivos: lectura en paralelo, gana el último código repetido
+            task = lambda db, progress, cancelled: import_csv_files(
+                db, file_paths, policy='last', progress=progress, cancel=cancelled
+            )
+        
+        # La importación corre en otro hilo con su propia conexión
+        self.import_task = BackgroundTask(
+            self.root,
+            self.db.db_path,
+            task,
+            on_progress=self.on_import_progress,
+            on_done=self.on_import_done,
+            on_error=self.on_import_error
+        )
+        self.import_started = time.perf_counter()
+        self.import_progress['value'] = 0
+        self.import_status_var.set("Importando...")
+        self.import_btn.config(state='disabled')
+        self.import_cancel_btn.config(state='normal')
+        self.import_task.start()
+    
+    def cancel_import(self):
+        """Pide cancelar la importación en curso"""
+        if self.import_task and self.import_task.running:
+            self.import_task.cancel()
+            self.import_status_var.set("Cancelando (se descarta el lote en curso)...")
+    
+    def on_import_progress(self, info):
+        """Actualiza la barra de progreso de la importación"""
+        elapsed = time.perf_counter() - self.import_started
+        rate = info['processed'] / elapsed if elapsed > 0 else 0
+        percent = info['fraction'] * 100
+        
+        self.import_progress['value'] = percent
+        self.import_status_var.set(
+            f"{info['processed']:,} filas procesadas · {rate:,.0f} filas/s · {percent:.0f}%"
+        )
+    
+    def finish_import(self):
+        """Restablece los controles de importación"""
+        self.import_task = None
+        self.import_btn.config(state='normal')
+        self.import_cancel_btn.config(state='disabled')
+    
+    def on_import_done(self, result):
+        """Muestra el resultado de la importación"""
+        self.finish_import()
+        self.import_progress['value'] = 0 if result['cancelled'] else 100
+        self.import_status_var.set("")
+        
+        title = "Importación Cancelada" if result['cancelled'] else "Importación Completada"
+        msg = f"{title}:\n\n"
+        msg += f"✅ Nuevos productos: {result['imported']}\n"
+        msg += f"🔄 Productos actualizados: {result['updated']}\n"
+        msg += f"📊 Total procesados: {result['total']}\n"
+        
+        if result.get('duplicates'):
+            msg += f"🔁 Códigos repetidos entre archivos: {result['duplicates']}\n"
+        
+        if result['errors']:
+            msg += f"\n⚠️ Errores: {len(result['errors'])}"
+        
+        messagebox.showinfo(title, msg)
+        self.refresh_data()
+    
+    def on_import_error(self, error):
+        """Informa un error de la importación"""
+        self.finish_import()
+        self.import_status_var.set("")
+        messagebox.showerror("Error", f"Error al importar archivo:\n{str(error)}")
+        self.refresh_data()
     
     def export_csv(self):
         """Exporta productos a CSV"""
@@ -547,36 +1181,84 @@ class OakyDesktopApp:
         if not file_path:
             return
         
-        try:
-            products = self.db.get_all_products()
-            
-            with open(file_path, 'w', encoding='utf-8', newline='') as file:
-                writer = csv.DictWriter(
-                    file,
-                    fieldnames=['barcode', 'name', 'price', 'stock']
-                )
-                writer.writeheader()
-                
-                for product in products:
-                    writer.writerow({
-                        'barcode': product['barcode'],
-                        'name': product['name'],
-                        'price': product['price'],
-                        'stock': product['stock']
-                    })
-            
-            messagebox.showinfo(
-                "Éxito",
-                f"Productos exportados exitosamente a:\n{file_path}"
-            )
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al exportar:\n{str(e)}")
+        from exporter import export_csv_file
+        
+        # La exportación corre en otro hilo con su propia conexión
+        self.export_task = BackgroundTask(
+            self.root,
+            self.db.db_path,
+            lambda db, progress, cancelled: export_csv_file(
+                db, file_path, progress=progress, cancel=cancelled
+            ),
+            on_progress=self.on_export_progress,
+            on_done=lambda result: self.on_export_done(file_path, result),
+            on_error=self.on_export_error
+        )
+        self.export_progress['value'] = 0
+        self.export_status_var.set("Exportando...")
+        self.export_btn.config(state='disabled')
+        self.export_cancel_btn.config(state='normal')
+        self.export_task.start()
+    
+    def cancel_export(self):
+        """Pide cancelar la exportación en curso"""
+        if self.export_task and self.export_task.running:
+            self.export_task.cancel()
+            self.export_status_var.set("Cancelando...")
+    
+    def on_export_progress(self, info):
+        """Actualiza la barra de progreso de la exportación"""
+        percent = info['fraction'] * 100
+        self.export_progress['value'] = percent
+        self.export_status_var.set(
+            f"{info['processed']:,} de {info['total']:,} productos · {percent:.0f}%"
+        )
+    
+    def finish_export(self):
+        """Restablece los controles de exportación"""
+        self.export_task = None
+        self.export_btn.config(state='normal')
+        self.export_cancel_btn.config(state='disabled')
+        self.export_status_var.set("")
+    
+    def on_export_done(self, file_path, result):
+        """Informa el resultado de la exportación"""
+        self.finish_export()
+        
+        if result['cancelled']:
+            self.export_progress['value'] = 0
+            messagebox.showinfo("Exportación Cancelada", "No se generó el archivo")
+            return
+        
+        self.export_progress['value'] = 100
+        messagebox.showinfo(
+            "Éxito",
+            f"Productos exportados exitosamente a:\n{file_path}"
+        )
+    
+    def on_export_error(self, error):
+        """Informa un error de la exportación"""
+        self.finish_export()
+        messagebox.showerror("Error", f"Error al exportar:\n{str(error)}")
     
     def refresh_data(self):
         """Refresca todos los datos"""
-        self.load_products()
+        if self.catalog is not None:
+            self.catalog.sync()
         self.update_stats()
+        if self.low_stock_only_var.get():
+            self.show_low_stock()
+        else:
+            self.load_products()
+    
+    def on_close(self):
+        """Cierra la aplicación liberando recursos"""
+        for task in (self.import_task, self.export_task, self.catalog_task):
+            if task:
+                task.cancel()
+        self.search_scheduler.stop()
+        self.db.close()
+        self.root.destroy()
 
 
 class ProductDialog:
@@ -584,7 +1266,7 @@ class ProductDialog:
     
     def __init__(self, parent, db, callback, product=None):
         self.db = db
-        self.callback = callback
+        self.callback = callback  # callback(producto_anterior, producto_nuevo)
         self.product = product
         
         # Crear ventana
@@ -719,27 +1401,82 @@ class ProductDialog:
         
         # Guardar
         if self.product:
-            # Actualizar
-            if self.db.update_product(barcode, name, price, stock):
+            # Actualizar: el stock se aplica como diferencia respecto de lo
+            # que se cargó, así no se pierden ventas registradas mientras tanto
+            delta = stock - self.product['stock']
+            error = None
+            try:
+                with self.db.transaction():
+                    [(success, message)] = self.db.update_products(
+                        [{'barcode': barcode, 'name': name, 'price': price}]
+                    )
+                    if not success:
+                        raise ValueError(message)
+                    if delta:
+                        success, message, _stock = self.db.adjust_stock(barcode, delta)
+                        if not success:
+                            raise ValueError(self.stock_error(message, barcode, delta))
+            except ValueError as e:
+                error = str(e)
+            except sqlite3.Error as e:
+                print(f"Error actualizando {barcode}: {e!r}", file=sys.stderr)
+                error = f"Error de base de datos: {str(e)}"
+            
+            if error is None:
                 messagebox.showinfo("Éxito", "Producto actualizado exitosamente")
-                self.callback()
+                self.callback(self.product, self.db.get_product(barcode))
                 self.dialog.destroy()
             else:
-                messagebox.showerror("Error", "No se pudo actualizar el producto")
+                messagebox.showerror("Error", f"No se pudo actualizar el producto:\n{error}")
         else:
             # Crear
             if self.db.add_product(barcode, name, price, stock):
                 messagebox.showinfo("Éxito", "Producto creado exitosamente")
-                self.callback()
+                self.callback(None, self.db.get_product(barcode))
                 self.dialog.destroy()
             else:
                 messagebox.showerror("Error", "Ya existe un producto con ese código de barras")
+    
+    def stock_error(self, message, barcode, delta):
+        """
+        Explica por qué se rechazó el cambio de stock
+        
+        El cambio se aplica como diferencia respecto del stock que había al
+        abrir el diálogo; si hubo ventas desde entonces, el actual es menor.
+        
+        Args:
+            message: Mensaje de adjust_stock
+            barcode: Código de barras
+            delta: Diferencia que se intentó aplicar
+            
+        Returns:
+            Texto para mostrar al usuario
+        """
+        loaded = self.product['stock']
+        text = f"{message}\nSe quiso cambiar el stock de {loaded} a {loaded + delta} ({delta:+d})"
+        
+        current = self.db.get_product(barcode)
+        if current is not None and current['stock'] != loaded:
+            text += (
+                f"\nEl stock cambió mientras el diálogo estaba abierto: ahora es "
+                f"{current['stock']}"
+            )
+        return text
 
 
 def main():
     """Función principal"""
+    startup = StartupTimer(STARTED_AT)
+    startup.mark("módulos")
+    
     root = tk.Tk()
-    app = OakyDesktopApp(root)
+    startup.mark("ventana")
+    app = OakyDesktopApp(
+        root,
+        use_snapshot='--snapshot' in sys.argv[1:],
+        startup=startup,
+        startup_report='--timing' in sys.argv[1:]
+    )
     root.mainloop()
 
 
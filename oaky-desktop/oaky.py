@@ -0,0 +1,223 @@
+"""
+Línea de comandos de Oaky Desktop
+Importa, exporta, reajusta precios y consulta la base sin abrir la interfaz
+
+Uso (desde la carpeta oaky-desktop):
+    python -m oaky import proveedor1.csv proveedor2.csv
+    python -m oaky export productos.csv
+    python -m oaky reprice 10 --name remera --dry-run
+    python -m oaky stats
+    python -m oaky search "jean azul" --limit 20
+
+La salida es JSON en stdout (el avance, si se pide, va a stderr como una
+línea JSON por lote). El código de salida es 0 si la operación terminó bien
+y 1 si falló. No importa tkinter, así que sirve para tareas de cron.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+from typing import Dict, Optional, Sequence
+
+from database import Database, IMPORT_CHUNK_SIZE, ITER_BATCH_SIZE, new_import_stats
+
+
+# Errores de importación incluidos en la salida (el total siempre se informa)
+MAX_REPORTED_ERRORS = 100
+
+# Resultados de búsqueda por defecto
+SEARCH_LIMIT = 50
+
+
+def emit(data: Dict, stream=None):
+    """Escribe un objeto JSON en una línea"""
+    stream = stream or sys.stdout
+    stream.write(json.dumps(data, ensure_ascii=False, default=str))
+    stream.write('\n')
+    stream.flush()
+
+
+def progress_printer(enabled: bool, **extra):
+    """Callback de avance que escribe en stderr, o None si no se pidió"""
+    if not enabled:
+        return None
+
+    def report(current: Dict):
+        emit({**extra, **current}, sys.stderr)
+
+    return report
+
+
+def import_result(stats: Dict, max_errors: int) -> Dict:
+    """Resumen serializable de una importación"""
+    errors = stats['errors']
+    result = {key: value for key, value in stats.items() if key != 'errors'}
+    result['ok'] = not stats['cancelled']
+    result['error_count'] = len(errors)
+    result['errors'] = errors[:max_errors]
+    return result
+
+
+def cmd_import(db: Database, args) -> Dict:
+    """Importa uno o más CSV"""
+    if args.parallel and len(args.files) > 1:
+        # Lectura en paralelo con deduplicación entre archivos (en memoria)
+        from importer import import_csv_files
+
+        stats = import_csv_files(
+            db, args.files, args.policy, args.chunk_size,
+            progress=progress_printer(args.progress)
+        )
+        return import_result(stats, args.max_errors)
+
+    # En streaming, archivo por archivo: con 'last' cada fila pisa a las
+    # anteriores; con 'first' se recuerdan los códigos importados (solo los
+    # códigos, no las filas) y se saltean las repeticiones
+    from importer import import_csv_file
+
+    seen = set() if args.policy == 'first' else None
+
+    stats = new_import_stats()
+    if seen is not None:
+        stats['duplicates'] = 0
+    for path in args.files:
+        current = import_csv_file(
+            db, path, args.chunk_size,
+            progress=progress_printer(args.progress, file=path),
+            seen=seen
+        )
+        for key in ('imported', 'updated', 'total', 'duplicates'):
+            if key in stats:
+                stats[key] += current[key]
+        stats['errors'].extend(current['errors'])
+
+    return import_result(stats, args.max_errors)
+
+
+def cmd_export(db: Database, args) -> Dict:
+    """Exporta el catálogo a CSV"""
+    from exporter import export_csv_file
+
+    result = export_csv_file(
+        db, args.file, args.batch_size,
+        progress=progress_printer(args.progress)
+    )
+    return {'ok': not result['cancelled'], 'file': args.file, **result}
+
+
+def cmd_reprice(db: Database, args) -> Dict:
+    """Cambio masivo de precios (o su vista previa, o deshacerlo)"""
+    if args.undo:
+        success, message = db.revert_price_batch()
+        return {'ok': success, 'message': message}
+
+    if args.percentage is None:
+        return {'ok': False, 'message': "Falta el porcentaje (o --undo)"}
+    if args.percentage == 0 or args.percentage <= -100:
+        return {'ok': False, 'message': "El porcentaje debe ser distinto de 0 y mayor a -100"}
+
+    filters = {'name_pattern': args.name, 'barcode_prefix': args.prefix}
+    preview = db.preview_price_update(args.percentage, **filters)
+    if args.dry_run:
+        return {'ok': True, 'dry_run': True, 'preview': preview}
+
+    success, message = db.update_prices_bulk(args.percentage, **filters)
+    return {'ok': success, 'message': message, 'preview': preview}
+
+
+def cmd_stats(db: Database, args) -> Dict:
+    """Estadísticas del inventario"""
+    stats = db.get_stats()
+    stats['low_stock_threshold'] = db.get_low_stock_threshold()
+    return {'ok': True, **stats}
+
+
+def cmd_search(db: Database, args) -> Dict:
+    """Búsqueda por código o nombre"""
+    results = db.search_products(args.query, args.limit, args.offset)
+    return {
+        'ok': True,
+        'query': args.query,
+        'total': db.count_products(args.query),
+        'offset': args.offset,
+        'results': [record.as_dict() for record in results]
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Define los subcomandos y sus opciones"""
+    parser = argparse.ArgumentParser(
+        prog='python -m oaky',
+        description="Oaky Desktop sin interfaz gráfica (salida JSON)"
+    )
+    parser.add_argument('--db', default='oaky.db', help="Archivo de base de datos (por defecto oaky.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('import', help="Importar productos desde uno o más CSV")
+    command.add_argument('files', nargs='+', help="Archivos CSV, en orden de prioridad")
+    command.add_argument('--parallel', action='store_true',
+                         help="Leer los archivos en paralelo (deduplica en memoria)")
+    command.add_argument('--policy', choices=('last', 'first'), default='last',
+                         help="Qué fila gana ante códigos repetidos (primera o última)")
+    command.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    command.add_argument('--max-errors', type=int, default=MAX_REPORTED_ERRORS,
+                         help="Errores de validación incluidos en la salida")
+    command.add_argument('--progress', action='store_true', help="Informar el avance en stderr")
+    command.set_defaults(handler=cmd_import)
+
+    command = commands.add_parser('export', help="Exportar el catálogo a CSV")
+    command.add_argument('file', help="Archivo CSV a crear")
+    command.add_argument('--batch-size', type=int, default=ITER_BATCH_SIZE)
+    command.add_argument('--progress', action='store_true', help="Informar el avance en stderr")
+    command.set_defaults(handler=cmd_export)
+
+    command = commands.add_parser('reprice', help="Cambio masivo de precios por porcentaje")
+    command.add_argument('percentage', type=float, nargs='?',
+                         help="Porcentaje (positivo aumenta, negativo descuenta)")
+    command.add_argument('--name', help="Solo productos cuyo nombre contiene este texto")
+    command.add_argument('--prefix', help="Solo códigos de barras que empiezan así")
+    command.add_argument('--dry-run', action='store_true', help="Mostrar el efecto sin aplicarlo")
+    command.add_argument('--undo', action='store_true', help="Deshacer el último cambio masivo")
+    command.set_defaults(handler=cmd_reprice)
+
+    command = commands.add_parser('stats', help="Estadísticas del inventario")
+    command.set_defaults(handler=cmd_stats)
+
+    command = commands.add_parser('search', help="Buscar productos por código o nombre")
+    command.add_argument('query', nargs='?', default='')
+    command.add_argument('--limit', type=int, default=SEARCH_LIMIT)
+    command.add_argument('--offset', type=int, default=0)
+    command.set_defaults(handler=cmd_search)
+
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Punto de entrada
+
+    Args:
+        argv: Argumentos (por defecto los de la línea de comandos)
+
+    Returns:
+        Código de salida
+    """
+    args = build_parser().parse_args(argv)
+
+    db = None
+    try:
+        db = Database(args.db)
+        result = args.handler(db, args)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        result = {'ok': False, 'message': f"Error: {str(e)}"}
+    finally:
+        if db is not None:
+            db.close()
+
+    emit(result)
+    return 0 if result.get('ok') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
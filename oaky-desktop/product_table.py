@@ -0,0 +1,319 @@
+"""
+Tabla de productos para Oaky Desktop
+Treeview virtual: solo materializa las filas visibles
+"""
+
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import DEFAULT_LOW_STOCK_THRESHOLD
+
+
+COLUMNS = ('Código', 'Nombre', 'Precio', 'Stock', 'Estado')
+
+
+def stock_status(stock: int, threshold: int = DEFAULT_LOW_STOCK_THRESHOLD) -> Tuple[str, str]:
+    """
+    Determina el estado de stock de un producto
+
+    Args:
+        stock: Cantidad en stock
+        threshold: Umbral de stock bajo
+
+    Returns:
+        Tupla (texto del estado, tag de color)
+    """
+    if stock == 0:
+        return "🔴 Sin Stock", 'red'
+    if stock < threshold:
+        return "🟡 Stock Bajo", 'yellow'
+    return "🟢 En Stock", 'green'
+
+
+class VirtualProductTable:
+    """
+    Tabla de productos con scroll virtual.
+
+    El Treeview contiene únicamente las filas que entran en pantalla; la
+    barra de desplazamiento representa el total de resultados y cada
+    movimiento pide a la fuente de datos la ventana correspondiente
+    (LIMIT/OFFSET), con un pequeño buffer en memoria alrededor de ella.
+    El costo de refrescar no depende del tamaño del catálogo.
+    """
+
+    DEFAULT_ROW_HEIGHT = 20
+
+    def __init__(self, parent, buffer_rows: int = 20):
+        """
+        Args:
+            parent: Widget contenedor
+            buffer_rows: Filas extra a mantener en memoria antes y después
+                de la ventana visible
+        """
+        self.buffer_rows = buffer_rows
+        self.low_stock_threshold = DEFAULT_LOW_STOCK_THRESHOLD
+        self.total = 0
+        self.first = 0
+        self._fetch = None
+        self._cache_start = 0
+        self._cache = []
+
+        self.frame = tk.Frame(parent)
+
+        # Scrollbars: la vertical la maneja la tabla, no el Treeview
+        self.y_scroll = ttk.Scrollbar(self.frame, command=self._on_yscroll)
+        self.y_scroll.pack(side='right', fill='y')
+
+        x_scroll = ttk.Scrollbar(self.frame, orient='horizontal')
+        x_scroll.pack(side='bottom', fill='x')
+
+        # Treeview (tabla)
+        self.tree = ttk.Treeview(
+            self.frame,
+            columns=COLUMNS,
+            show='headings',
+            xscrollcommand=x_scroll.set
+        )
+        x_scroll.config(command=self.tree.xview)
+
+        # Configurar columnas
+        self.tree.heading('Código', text='Código de Barras')
+        self.tree.heading('Nombre', text='Nombre del Producto')
+        self.tree.heading('Precio', text='Precio')
+        self.tree.heading('Stock', text='Stock')
+        self.tree.heading('Estado', text='Estado')
+
+        self.tree.column('Código', width=150)
+        self.tree.column('Nombre', width=400)
+        self.tree.column('Precio', width=120)
+        self.tree.column('Stock', width=80)
+        self.tree.column('Estado', width=120)
+
+        # Configurar colores (una sola vez)
+        self.tree.tag_configure('red', background='#fee2e2')
+        self.tree.tag_configure('yellow', background='#fef3c7')
+        self.tree.tag_configure('green', background='#d1fae5')
+
+        self.tree.pack(fill='both', expand=True)
+
+        # Filas a pedir de una vez a la base de datos. Se recalcula en cada
+        # render para que los hilos de búsqueda lo lean sin tocar Tk
+        self.page_size = self.visible_rows + 2 * self.buffer_rows
+
+        # Desplazamiento
+        self.tree.bind('<Configure>', lambda e: self._render())
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll(3))
+        self.tree.bind('<Prior>', lambda e: self.scroll(-self.visible_rows))
+        self.tree.bind('<Next>', lambda e: self.scroll(self.visible_rows))
+        self.tree.bind('<Up>', lambda e: self._on_arrow(-1))
+        self.tree.bind('<Down>', lambda e: self._on_arrow(1))
+
+    def pack(self, **kwargs):
+        """Ubica la tabla en su contenedor"""
+        self.frame.pack(**kwargs)
+
+    @property
+    def visible_rows(self) -> int:
+        """Cantidad de filas que entran en pantalla"""
+        height = self.tree.winfo_height()
+        if height <= 1:
+            # Todavía no se dibujó: usar la altura configurada
+            return int(self.tree.cget('height'))
+
+        row_height = ttk.Style().lookup('Treeview', 'rowheight') or self.DEFAULT_ROW_HEIGHT
+        # Se descuenta una fila por los encabezados
+        return max(1, height // int(row_height) - 1)
+
+    def set_source(self, total: int, fetch: Callable[[int, int], List[Dict]],
+                   first_rows: Optional[List[Dict]] = None):
+        """
+        Cambia los datos mostrados y vuelve al principio
+
+        Args:
+            total: Cantidad total de filas
+            fetch: Función (offset, limit) que devuelve una ventana de productos
+            first_rows: Primeras filas ya obtenidas (opcional)
+        """
+        self.total = total
+        self._fetch = fetch
+        self.first = 0
+        self._cache_start = 0
+        self._cache = list(first_rows) if first_rows is not None else []
+        self._render()
+
+    def refresh(self):
+        """Vuelve a pedir la ventana actual manteniendo la posición"""
+        self._cache = []
+        self._render()
+
+    def scroll(self, rows: int):
+        """Desplaza la ventana visible una cantidad de filas"""
+        self.scroll_to(self.first + rows)
+        return 'break'
+
+    def scroll_to(self, index: int):
+        """Ubica la fila indicada al principio de la ventana visible"""
+        self.first = index
+        self._render()
+
+    def selected_barcodes(self) -> List[str]:
+        """Códigos de barras de las filas seleccionadas"""
+        return list(self.tree.selection())
+
+    def _rows(self, start: int, count: int) -> List[Dict]:
+        """Devuelve las filas [start, start + count) usando el buffer"""
+        end = min(start + count, self.total)
+        cache_end = self._cache_start + len(self._cache)
+
+        if start < self._cache_start or end > cache_end:
+            if self._fetch is None:
+                return []
+            self._cache_start = max(0, start - self.buffer_rows)
+            self._cache = self._fetch(self._cache_start, count + 2 * self.buffer_rows)
+
+        offset = start - self._cache_start
+        return self._cache[offset:offset + count]
+
+    def _render(self):
+        """
+        Materializa en el Treeview solo la ventana visible.
+        Las filas que ya estaban se reutilizan (se actualizan y reordenan)
+        en lugar de borrarse y volver a insertarse.
+        """
+        count = self.visible_rows
+        self.page_size = count + 2 * self.buffer_rows
+        self.first = max(0, min(self.first, self.total - count))
+
+        # Un producto recién creado puede figurar dos veces en el buffer
+        rows = {}
+        for product in self._rows(self.first, count):
+            rows.setdefault(product['barcode'], product)
+
+        stale = [iid for iid in self.tree.get_children() if iid not in rows]
+        if stale:
+            self.tree.delete(*stale)
+
+        for index, (barcode, product) in enumerate(rows.items()):
+            values, tags = self._row_values(product)
+            if self.tree.exists(barcode):
+                self.tree.item(barcode, values=values, tags=tags)
+                self.tree.move(barcode, '', index)
+            else:
+                self.tree.insert('', index, iid=barcode, values=values, tags=tags)
+
+        self._update_scrollbar(count)
+
+    def insert_row(self, product: Dict):
+        """
+        Agrega un producto nuevo al principio de la ventana visible.
+        Ocupará su lugar según el orden en la próxima búsqueda.
+        """
+        index = self.first - self._cache_start
+        if 0 <= index <= len(self._cache):
+            self._cache.insert(index, product)
+        self.total += 1
+        self._render()
+        self.tree.selection_set(product['barcode'])
+        self.tree.see(product['barcode'])
+
+    def update_row(self, product: Dict):
+        """Actualiza en el lugar la fila de un producto, si está cargada"""
+        index = self._cache_index(product['barcode'])
+        if index is not None:
+            self._cache[index] = product
+
+        if self.tree.exists(product['barcode']):
+            values, tags = self._row_values(product)
+            self.tree.item(product['barcode'], values=values, tags=tags)
+
+    def remove_row(self, barcode: str):
+        """Quita la fila de un producto eliminado"""
+        index = self._cache_index(barcode)
+        if index is not None:
+            del self._cache[index]
+            if index < self.first - self._cache_start:
+                # La fila estaba antes de la ventana visible: todo sube una fila
+                self.first -= 1
+        elif self._cache_start > 0:
+            # No está en el buffer: no se sabe dónde estaba, volver a pedirlo
+            self._cache = []
+
+        self.total = max(0, self.total - 1)
+        self._render()
+
+    def apply_delta(self, old: Optional[Dict], new: Optional[Dict]):
+        """
+        Aplica a la tabla el cambio de un solo producto
+
+        Args:
+            old: Producto antes del cambio (None si es nuevo)
+            new: Producto después del cambio (None si se eliminó)
+        """
+        if old is None and new is not None:
+            self.insert_row(new)
+        elif new is None and old is not None:
+            self.remove_row(old['barcode'])
+        elif new is not None:
+            self.update_row(new)
+
+    def _cache_index(self, barcode: str) -> Optional[int]:
+        """Posición de un producto dentro del buffer (o None)"""
+        for index, product in enumerate(self._cache):
+            if product['barcode'] == barcode:
+                return index
+        return None
+
+    def _row_values(self, product: Dict) -> Tuple[tuple, tuple]:
+        """Valores y tags de la fila de un producto"""
+        estado, tag = stock_status(product['stock'], self.low_stock_threshold)
+        values = (
+            product['barcode'],
+            product['name'],
+            f"${product['price']:,.2f}",
+            product['stock'],
+            estado
+        )
+        return values, (tag,)
+
+    def _update_scrollbar(self, count: int):
+        """Ajusta la barra vertical a la posición dentro del total"""
+        if self.total <= 0:
+            self.y_scroll.set(0, 1)
+            return
+
+        top = self.first / self.total
+        bottom = min(1.0, (self.first + count) / self.total)
+        self.y_scroll.set(top, bottom)
+
+    def _on_yscroll(self, action, value, unit=None):
+        """Comando de la barra vertical (moveto / scroll)"""
+        if action == 'moveto':
+            self.scroll_to(int(float(value) * self.total))
+        elif action == 'scroll':
+            step = self.visible_rows if unit == 'pages' else 1
+            self.scroll(int(value) * step)
+
+    def _on_mousewheel(self, event):
+        """Rueda del mouse (Windows / macOS)"""
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def _on_arrow(self, direction: int):
+        """Flechas: al llegar al borde de la ventana, desplazar una fila"""
+        children = self.tree.get_children()
+        if not children:
+            return None
+
+        edge = children[0] if direction < 0 else children[-1]
+        if self.tree.focus() != edge:
+            return None
+
+        self.scroll(direction)
+        children = self.tree.get_children()
+        if children:
+            target = children[0] if direction < 0 else children[-1]
+            self.tree.selection_set(target)
+            self.tree.focus(target)
+        return 'break'
@@ -0,0 +1,86 @@
+"""
+Registros livianos para las filas de Oaky Desktop
+Tuplas con acceso por nombre, más chicas y rápidas de armar que un dict
+"""
+
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class Record(tuple):
+    """
+    Fila de una consulta: una tupla que también se lee por nombre.
+
+    Se construye directamente desde la tupla que devuelve sqlite3 (sin
+    código Python por fila) y ocupa bastante menos que un dict. Admite
+    record['name'], record.name, record.get('name'), dict(record) y
+    record[0], así que reemplaza a los diccionarios que devolvía Database.
+    """
+
+    __slots__ = ()
+
+    _fields: Tuple[str, ...] = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def __repr__(self) -> str:
+        values = ', '.join(f"{name}={value!r}" for name, value in zip(self._fields, self))
+        return f"{type(self).__name__}({values})"
+
+    def keys(self) -> Tuple[str, ...]:
+        """Nombres de las columnas (permite dict(record))"""
+        return self._fields
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Valor de una columna, o default si la fila no la tiene"""
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Copia como diccionario (por ejemplo para serializar a JSON)"""
+        return dict(zip(self._fields, self))
+
+
+@lru_cache(maxsize=None)
+def record_type(columns: Tuple[str, ...]) -> type:
+    """
+    Clase de registro para un conjunto de columnas (una por combinación)
+
+    Args:
+        columns: Nombres de las columnas, en el orden de la consulta
+
+    Returns:
+        Subclase de Record con una propiedad por columna
+    """
+    namespace = {
+        '__slots__': (),
+        '_fields': columns,
+        '_index': {name: index for index, name in enumerate(columns)},
+    }
+    for index, name in enumerate(columns):
+        namespace[name] = property(itemgetter(index))
+
+    return type('ProductRecord', (Record,), namespace)
+
+
+def to_records(description: Iterable[tuple], rows: Iterable[tuple]) -> List[Record]:
+    """
+    Convierte filas de un cursor (sin row_factory) en registros
+
+    Args:
+        description: cursor.description de la consulta
+        rows: Tuplas devueltas por fetchall/fetchmany
+
+    Returns:
+        Lista de registros
+    """
+    cls = record_type(tuple(column[0] for column in description))
+    return list(map(cls, rows))
@@ -0,0 +1,79 @@
+"""
+Lector de códigos de barras para Oaky Desktop
+Distingue la ráfaga de teclas de un escáner de lo que tipea una persona
+"""
+
+from typing import List, Optional
+
+
+# Un escáner "tipea" cada carácter con pocos milisegundos de diferencia
+SCANNER_MAX_GAP_MS = 35
+
+# Códigos más cortos se tratan como texto tipeado
+SCANNER_MIN_LENGTH = 4
+
+
+class ScanDetector:
+    """
+    Detecta códigos leídos por un escáner (teclado USB/HID).
+
+    Se le pasan las teclas con su hora (event.time de Tk, en ms). Mientras
+    los caracteres llegan con menos de max_gap_ms entre sí se acumulan en
+    una ráfaga; si pasa más tiempo la ráfaga vuelve a empezar. Un Enter
+    inmediatamente después de una ráfaga suficientemente larga es un
+    escaneo completo.
+    """
+
+    def __init__(self, max_gap_ms: int = SCANNER_MAX_GAP_MS,
+                 min_length: int = SCANNER_MIN_LENGTH):
+        """
+        Args:
+            max_gap_ms: Tiempo máximo entre teclas de una misma ráfaga
+            min_length: Largo mínimo de un código escaneado
+        """
+        self.max_gap_ms = max_gap_ms
+        self.min_length = min_length
+        self._chars: List[str] = []
+        self._last_time = None
+
+    @property
+    def in_burst(self) -> bool:
+        """Indica si las últimas teclas llegaron a velocidad de escáner"""
+        return len(self._chars) > 1
+
+    def reset(self):
+        """Descarta la ráfaga en curso"""
+        self._chars = []
+        self._last_time = None
+
+    def feed(self, char: str, time_ms: int):
+        """
+        Registra un carácter tipeado
+
+        Args:
+            char: Carácter (un solo carácter imprimible)
+            time_ms: Hora de la tecla en milisegundos
+        """
+        if self._last_time is None or time_ms - self._last_time > self.max_gap_ms:
+            self._chars = []
+        self._chars.append(char)
+        self._last_time = time_ms
+
+    def finish(self, time_ms: int) -> Optional[str]:
+        """
+        Procesa un Enter
+
+        Args:
+            time_ms: Hora del Enter en milisegundos
+
+        Returns:
+            El código escaneado, o None si el Enter no cierra una ráfaga
+        """
+        chars, last_time = self._chars, self._last_time
+        self.reset()
+
+        if last_time is None or time_ms - last_time > self.max_gap_ms:
+            return None
+        if len(chars) < self.min_length:
+            return None
+        return ''.join(chars).strip() or None
@@ -0,0 +1,956 @@
+"""
+Servidor HTTP local de Oaky Desktop
+API JSON sobre Database para la interfaz web: búsqueda paginada, lectura
+por código de barras y cambios por lote, con ETag y gzip
+
+Uso (desde la carpeta oaky-desktop):
+    python server.py --static ..        # API + index.html en http://127.0.0.1:8765/
+
+Rutas:
+    GET  /api/products?q=&limit=&offset=&low_stock=1
+    GET  /api/products/<barcode>
+    POST /api/products/lookup    {"barcodes": [...]}
+    POST /api/products/batch     {"create": [...], "update": [...], "delete": [...],
+                                  "adjust_stock": [{"barcode", "delta"}], "reason", "atomic"}
+    GET  /api/stats
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from database import Database, STOCK_REASON_ADJUSTMENT
+
+
+DEFAULT_HOST = '127.0.0.1'           # solo accesible desde esta PC
+DEFAULT_PORT = 8765
+
+PAGE_SIZE = 50                       # productos por página por defecto
+MAX_PAGE_SIZE = 500
+MAX_LOOKUP_BARCODES = 5000           # códigos por pedido de lookup
+MAX_BATCH_ITEMS = 10000              # filas por lista en un lote
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+GZIP_MIN_BYTES = 1024                # respuestas más chicas van sin comprimir
+GZIP_LEVEL = 6
+
+SERVER_THREADS = 8                   # hilos (y conexiones de lectura) del servidor
+KEEPALIVE_TIMEOUT_S = 5.0            # una conexión inactiva libera su hilo
+
+JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+# Modo asyncio (--async)
+ASYNC_READ_WORKERS = 8               # hilos (y conexiones) de lectura
+ASYNC_MAX_PENDING_READS = 256        # lecturas en curso o en espera antes de responder 503
+ASYNC_WRITE_QUEUE_SIZE = 128         # escrituras en cola antes de responder 503
+ASYNC_MAX_CONNECTIONS = 512
+WRITE_GROUP_MAX = 32                 # escrituras confirmadas juntas como máximo
+RETRY_AFTER_S = 1
+MAX_HEADERS = 100
+METRICS_WINDOW = 2048                # mediciones guardadas por ruta
+
+
+class ApiError(Exception):
+    """Error de la API con su código HTTP"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class _BatchRejected(Exception):
+    """Revierte un lote atómico con errores"""
+
+
+def _int_param(query: Dict[str, List[str]], name: str, default: int,
+               minimum: int = 0, maximum: Optional[int] = None) -> int:
+    """Lee un parámetro entero de la query string"""
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[-1])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} debe ser un número entero") from None
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} fuera de rango")
+    return value
+
+
+def _list_field(body: Dict, name: str, item_type: type) -> List:
+    """Lee una lista del cuerpo de un pedido validando el tipo de sus elementos"""
+    items = body.get(name) or []
+    if not isinstance(items, list) or not all(isinstance(item, item_type) for item in items):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} debe ser una lista de {item_type.__name__}")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"{name}: máximo {MAX_BATCH_ITEMS} elementos")
+    return items
+
+
+def encode_json(payload: Any) -> bytes:
+    """Serializa una respuesta a JSON compacto"""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def decode_json(data: bytes, content_encoding: Optional[str] = None) -> Any:
+    """Decodifica el cuerpo JSON de un pedido (opcionalmente con gzip)"""
+    try:
+        if content_encoding == 'gzip':
+            data = gzip.decompress(data)
+        return json.loads(data or b'null')
+    except (OSError, EOFError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "JSON inválido") from None
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Indica si el encabezado Accept-Encoding admite gzip"""
+    for coding in (accept_encoding or '').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip() == 'gzip':
+            return params.replace(' ', '') not in ('q=0', 'q=0.0')
+    return False
+
+
+def build_response(status: int, body: bytes, content_type: str, cacheable: bool,
+                   accept_encoding: Optional[str] = None, if_none_match: Optional[str] = None,
+                   allow_origin: Optional[str] = None) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """
+    Arma una respuesta con ETag (validación condicional) y gzip si el
+    cliente lo acepta
+
+    Args:
+        status: Código HTTP
+        body: Cuerpo sin comprimir
+        content_type: Tipo del cuerpo
+        cacheable: Calcular ETag (solo respuestas GET)
+        accept_encoding: Encabezado Accept-Encoding del pedido
+        if_none_match: Encabezado If-None-Match del pedido
+        allow_origin: Origen permitido por CORS (o None)
+
+    Returns:
+        Tupla (código, encabezados, cuerpo a enviar)
+    """
+    headers = []
+    if allow_origin:
+        headers += [('Access-Control-Allow-Origin', allow_origin), ('Vary', 'Origin')]
+
+    etag = None
+    if cacheable and status == HTTPStatus.OK:
+        # ETag débil: identifica el contenido, no la codificación (gzip)
+        etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        # Siempre revalidar: el catálogo cambia sin aviso
+        headers += [('ETag', etag), ('Cache-Control', 'no-cache')]
+
+        tags = [tag.strip() for tag in (if_none_match or '').split(',')]
+        if '*' in tags or etag in tags:
+            return HTTPStatus.NOT_MODIFIED, headers + [('Content-Length', '0')], b''
+
+    headers += [('Content-Type', content_type), ('Vary', 'Accept-Encoding')]
+    if len(body) >= GZIP_MIN_BYTES and accepts_gzip(accept_encoding):
+        body = gzip.compress(body, GZIP_LEVEL)
+        headers.append(('Content-Encoding', 'gzip'))
+    headers.append(('Content-Length', str(len(body))))
+
+    return status, headers, body
+
+
+def read_static(static_dir: str, path: str) -> Optional[Tuple[bytes, str]]:
+    """
+    Lee un archivo de la carpeta estática sin salir de ella
+
+    Returns:
+        Tupla (contenido, tipo) o None si no existe
+    """
+    root = os.path.realpath(static_dir)
+    relative = unquote(path).lstrip('/') or 'index.html'
+    file_path = os.path.realpath(os.path.join(root, relative))
+
+    if os.path.commonpath([root, file_path]) != root or not os.path.isfile(file_path):
+        return None
+
+    with open(file_path, 'rb') as file:
+        body = file.read()
+    return body, mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+
+class OakyApi:
+    """
+    Rutas de la API, independientes del transporte HTTP.
+
+    handle recibe el método, la ruta, la query string ya separada y el
+    cuerpo JSON ya decodificado, y devuelve (código, objeto serializable).
+    Es seguro llamarlo desde varios hilos: Database da a cada hilo su
+    propia conexión de lectura y serializa las escrituras.
+    """
+
+    def __init__(self, db: Database):
+        """
+        Args:
+            db: Base de datos compartida por todos los pedidos
+        """
+        self.db = db
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]],
+               body: Any = None) -> Tuple[int, Any]:
+        """
+        Atiende un pedido
+
+        Returns:
+            Tupla (código HTTP, respuesta)
+
+        Raises:
+            ApiError: Ruta inexistente o pedido inválido
+        """
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts[0] != 'api' or len(parts) < 2:
+            raise ApiError(HTTPStatus.NOT_FOUND, "Ruta inexistente")
+        route = parts[1:]
+
+        if method == 'GET':
+            if route == ['products']:
+                return HTTPStatus.OK, self.search(query)
+            if route == ['stats']:
+                return HTTPStatus.OK, self.db.get_stats()
+            if len(route) == 2 and route[0] == 'products':
+                return HTTPStatus.OK, self.product(route[1])
+        elif method == 'POST':
+            if not isinstance(body, dict):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "El cuerpo debe ser un objeto JSON")
+            if route == ['products', 'lookup']:
+                return HTTPStatus.OK, self.lookup(body)
+            if route == ['products', 'batch']:
+                return self.batch(body)
+
+        single_product = len(route) == 2 and route[0] == 'products'
+        if route in (['products'], ['stats']) or single_product:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Método no permitido")
+        raise ApiError(HTTPStatus.NOT_FOUND, "Ruta inexistente")
+
+    @staticmethod
+    def is_write(method: str, path: str) -> bool:
+        """Indica si el pedido modifica la base (el resto son lecturas)"""
+        return method == 'POST' and path.rstrip('/') == '/api/products/batch'
+
+    def search(self, query: Dict[str, List[str]]) -> Dict:
+        """Una página de la búsqueda (o del reporte de stock bajo)"""
+        limit = _int_param(query, 'limit', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+        offset = _int_param(query, 'offset', 0)
+
+        if query.get('low_stock', ['0'])[-1] in ('1', 'true'):
+            search_term = ''
+            items = self.db.get_low_stock_products(limit, offset)
+            total = self.db.get_stats()['low_stock']
+        else:
+            search_term = query.get('q', [''])[-1].strip()
+            items = self.db.search_products(search_term, limit, offset)
+            if search_term:
+                total = self.db.count_products(search_term)
+            else:
+                total = self.db.get_stats()['total_products']
+
+        return {
+            'query': search_term,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'items': [item.as_dict() for item in items]
+        }
+
+    def product(self, barcode: str) -> Dict:
+        """Un producto por código de barras"""
+        product = self.db.get_product_by_barcode(barcode)
+        if product is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"Producto no encontrado: {barcode}")
+        return product.as_dict()
+
+    def lookup(self, body: Dict) -> Dict:
+        """Varios productos por código de barras en una sola consulta"""
+        barcodes = _list_field(body, 'barcodes', str)
+        if len(barcodes) > MAX_LOOKUP_BARCODES:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                           f"barcodes: máximo {MAX_LOOKUP_BARCODES} códigos")
+
+        found = self.db.get_products_by_barcodes(barcodes)
+        return {
+            'items': {barcode: product.as_dict() for barcode, product in found.items()},
+            'missing': [barcode for barcode in dict.fromkeys(barcodes) if barcode not in found]
+        }
+
+    def batch(self, body: Dict) -> Tuple[int, Dict]:
+        """
+        Altas, cambios, movimientos de stock y bajas (en ese orden) en una
+        sola transacción
+
+        Cada lista informa el resultado de cada fila en el mismo orden. Con
+        "atomic": true, si alguna fila falla no se aplica nada (409).
+        """
+        creates = _list_field(body, 'create', dict)
+        updates = _list_field(body, 'update', dict)
+        deletes = _list_field(body, 'delete', str)
+        movements = _list_field(body, 'adjust_stock', dict)
+        reason = str(body.get('reason') or STOCK_REASON_ADJUSTMENT)
+        atomic = bool(body.get('atomic'))
+
+        # Un delta no entero se informa en su fila (ver adjust_stock_batch)
+        try:
+            movements = [(str(item['barcode']), item['delta']) for item in movements]
+        except KeyError:
+            raise ApiError(HTTPStatus.BAD_REQUEST,
+                           "adjust_stock: cada elemento necesita barcode y delta") from None
+
+        result = {}
+        try:
+            with self.db.transaction():
+                result['create'] = [
+                    {'ok': ok, 'message': message, 'id': product_id}
+                    for ok, message, product_id in (self.db.create_products(creates) if creates else [])
+                ]
+                result['update'] = [
+                    {'ok': ok, 'message': message}
+                    for ok, message in (self.db.update_products(updates) if updates else [])
+                ]
+                result['adjust_stock'] = [
+                    {'ok': ok, 'message': message, 'stock': stock}
+                    for ok, message, stock in (
+                        self.db.adjust_stock_batch(movements, reason) if movements else []
+                    )
+                ]
+                result['delete'] = [
+                    {'ok': ok, 'message': message}
+                    for ok, message in (self.db.delete_products(deletes) if deletes else [])
+                ]
+
+                if atomic and not all(row['ok'] for rows in result.values() for row in rows):
+                    raise _BatchRejected()
+        except _BatchRejected:
+            result['committed'] = False
+            return HTTPStatus.CONFLICT, result
+
+        result['committed'] = True
+        return HTTPStatus.OK, result
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """Traduce pedidos HTTP a OakyApi y escribe las respuestas"""
+
+    server_version = 'OakyDesktop'
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEPALIVE_TIMEOUT_S
+    # Encabezados y cuerpo salen en escrituras separadas: sin TCP_NODELAY
+    # cada respuesta esperaría el ACK demorado del cliente
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_OPTIONS(self):
+        """Preflight CORS (solo si se configuró un origen permitido)"""
+        if self._reject_chunked():
+            return
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self._send_cors_headers()
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _dispatch(self, method: str):
+        if self._reject_chunked():
+            return
+        url = urlsplit(self.path)
+
+        if method == 'GET' and not url.path.startswith('/api/') and self.server.static_dir:
+            self._send_static(url.path)
+            return
+
+        try:
+            body = self._read_json() if method == 'POST' else None
+            status, payload = self.server.api.handle(method, url.path, parse_qs(url.query), body)
+        except ApiError as e:
+            status, payload = e.status, {'error': e.message}
+        except Exception as e:
+            self.log_error("Error atendiendo %s %s: %r", method, self.path, e)
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Error: {str(e)}"}
+
+        self._send_body(status, encode_json(payload), JSON_CONTENT_TYPE, cacheable=method == 'GET')
+
+    def _reject_chunked(self) -> bool:
+        """
+        Responde 411 y cierra la conexión si el pedido trae
+        Transfer-Encoding: el cuerpo solo se lee por Content-Length, y los
+        chunks sin leer se tomarían como el pedido siguiente
+
+        Returns:
+            True si el pedido ya fue respondido
+        """
+        if self.headers.get('Transfer-Encoding') is None:
+            return False
+
+        self.close_connection = True
+        self._send_body(HTTPStatus.LENGTH_REQUIRED,
+                        encode_json({'error': "Transfer-Encoding no soportado: usar Content-Length"}),
+                        JSON_CONTENT_TYPE, cacheable=False)
+        return True
+
+    def _read_json(self) -> Any:
+        """
+        Lee y decodifica el cuerpo JSON del pedido
+
+        Ante cualquier error del cuerpo se cierra la conexión después de
+        responder: pudo quedar sin leer y el próximo pedido se leería
+        desde la mitad.
+        """
+        try:
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Content-Length inválido")
+            if length > MAX_BODY_BYTES:
+                raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Pedido demasiado grande")
+
+            data = self.rfile.read(length) if length else b''
+            return decode_json(data, self.headers.get('Content-Encoding'))
+        except ApiError:
+            self.close_connection = True
+            raise
+
+    def _send_cors_headers(self):
+        if self.server.allow_origin:
+            self.send_header('Access-Control-Allow-Origin', self.server.allow_origin)
+            self.send_header('Vary', 'Origin')
+
+    def _send_body(self, status: int, body: bytes, content_type: str, cacheable: bool):
+        status, headers, body = build_response(
+            status, body, content_type, cacheable,
+            self.headers.get('Accept-Encoding'), self.headers.get('If-None-Match'),
+            self.server.allow_origin
+        )
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_static(self, path: str):
+        """Sirve un archivo de la carpeta estática (la interfaz web)"""
+        static = read_static(self.server.static_dir, path)
+        if static is None:
+            self._send_body(HTTPStatus.NOT_FOUND, encode_json({'error': "Archivo inexistente"}),
+                            JSON_CONTENT_TYPE, cacheable=False)
+        else:
+            self._send_body(HTTPStatus.OK, *static, cacheable=True)
+
+
+class ApiServer(HTTPServer):
+    """
+    Servidor HTTP con un grupo fijo de hilos.
+
+    A diferencia de ThreadingHTTPServer (un hilo nuevo por conexión), los
+    hilos se reutilizan, así cada uno conserva su conexión de lectura a
+    SQLite y la cantidad de conexiones abiertas queda acotada.
+    """
+
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], db: Database, threads: int = SERVER_THREADS,
+                 static_dir: Optional[str] = None, allow_origin: Optional[str] = None,
+                 verbose: bool = False):
+        """
+        Args:
+            address: (host, puerto)
+            db: Base de datos a exponer
+            threads: Pedidos atendidos a la vez
+            static_dir: Carpeta con la interfaz web a servir en / (opcional)
+            allow_origin: Origen permitido por CORS (por defecto ninguno)
+            verbose: Registrar cada pedido en stderr
+        """
+        super().__init__(address, ApiRequestHandler)
+        self.api = OakyApi(db)
+        self.static_dir = static_dir
+        self.allow_origin = allow_origin
+        self.verbose = verbose
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix='oaky-http')
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+class LatencyMetrics:
+    """
+    Latencia por ruta de los últimos pedidos.
+
+    Guarda una ventana acotada de mediciones por ruta (los percentiles se
+    calculan al consultar) y contadores globales de pedidos rechazados por
+    sobrecarga. Solo se usa desde el loop de asyncio.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        """
+        Args:
+            window: Mediciones guardadas por ruta
+        """
+        self.window = window
+        self.started_at = time.monotonic()
+        self.rejected = 0
+        self._routes: Dict[str, Dict] = {}
+
+    def record(self, route: str, seconds: float, status: int):
+        """Registra un pedido terminado"""
+        stats = self._routes.get(route)
+        if stats is None:
+            stats = {'count': 0, 'errors': 0, 'samples': deque(maxlen=self.window)}
+            self._routes[route] = stats
+        stats['count'] += 1
+        if status >= 500:
+            stats['errors'] += 1
+        stats['samples'].append(seconds * 1000)
+
+    def snapshot(self) -> Dict:
+        """
+        Resumen de las métricas
+
+        Returns:
+            Diccionario con uptime_s, rejected y, por ruta, count, errors y
+            latencias (mean, p50, p95, p99 y max en milisegundos)
+        """
+        routes = {}
+        for route, stats in self._routes.items():
+            samples = sorted(stats['samples'])
+            last = len(samples) - 1
+            routes[route] = {
+                'count': stats['count'],
+                'errors': stats['errors'],
+                'mean_ms': round(sum(samples) / len(samples), 3),
+                'p50_ms': round(samples[last // 2], 3),
+                'p95_ms': round(samples[last * 95 // 100], 3),
+                'p99_ms': round(samples[last * 99 // 100], 3),
+                'max_ms': round(samples[last], 3)
+            }
+        return {
+            'uptime_s': round(time.monotonic() - self.started_at, 1),
+            'rejected': self.rejected,
+            'routes': routes
+        }
+
+
+def metrics_route(method: str, path: str) -> str:
+    """Nombre de ruta para las métricas (sin el código de barras)"""
+    parts = path.rstrip('/').split('/')
+    if len(parts) == 4 and parts[1:3] == ['api', 'products'] and parts[3] not in ('lookup', 'batch'):
+        parts[3] = '<barcode>'
+    elif parts[1:2] != ['api']:
+        return f"{method} (estático)"
+    return f"{method} {'/'.join(parts)}"
+
+
+class AsyncApiServer:
+    """
+    Servidor HTTP/1.1 sobre asyncio para muchas terminales a la vez.
+
+    Un solo hilo atiende todas las conexiones; el trabajo con la base se
+    reparte así:
+
+    - Lecturas: un grupo fijo de hilos, cada uno con su propia conexión de
+      lectura (WAL), así las consultas corren en paralelo.
+    - Escrituras: una cola acotada que consume un único hilo escritor. Los
+      pedidos que se acumulan mientras se aplica uno se agrupan en una sola
+      transacción (cada uno en su savepoint), así se confirma una vez por
+      grupo y no por pedido.
+    - Sobrecarga: si se supera el máximo de conexiones, de lecturas en
+      espera o de escrituras en cola, se responde 503 con Retry-After en
+      lugar de acumular trabajo sin límite.
+
+    Cada respuesta informa su duración en Server-Timing y GET /api/metrics
+    devuelve las latencias por ruta (ver LatencyMetrics).
+    """
+
+    def __init__(self, db: Database, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 read_workers: int = ASYNC_READ_WORKERS,
+                 max_pending_reads: int = ASYNC_MAX_PENDING_READS,
+                 write_queue_size: int = ASYNC_WRITE_QUEUE_SIZE,
+                 max_connections: int = ASYNC_MAX_CONNECTIONS,
+                 static_dir: Optional[str] = None, allow_origin: Optional[str] = None):
+        """
+        Args:
+            db: Base de datos a exponer
+            host: Dirección de escucha
+            port: Puerto (0 elige uno libre)
+            read_workers: Hilos (y conexiones) de lectura
+            max_pending_reads: Lecturas en curso o en espera antes de responder 503
+            write_queue_size: Escrituras en cola antes de responder 503
+            max_connections: Conexiones abiertas a la vez
+            static_dir: Carpeta con la interfaz web a servir en / (opcional)
+            allow_origin: Origen permitido por CORS (por defecto ninguno)
+        """
+        self.api = OakyApi(db)
+        self.host = host
+        self.port = port
+        self.max_pending_reads = max_pending_reads
+        self.write_queue_size = write_queue_size
+        self.max_connections = max_connections
+        self.static_dir = static_dir
+        self.allow_origin = allow_origin
+        self.metrics = LatencyMetrics()
+
+        self.pending_reads = 0
+        self.connections = 0
+        self.writes = 0
+        self.write_commits = 0
+        self._read_pool = ThreadPoolExecutor(read_workers, thread_name_prefix='oaky-read')
+        self._write_pool = ThreadPoolExecutor(1, thread_name_prefix='oaky-write')
+        self._writes: Optional[asyncio.Queue] = None
+        self._writer_task = None
+        self._server = None
+
+    async def start(self):
+        """Empieza a escuchar (port queda con el puerto real)"""
+        self._writes = asyncio.Queue(self.write_queue_size)
+        self._writer_task = asyncio.create_task(self._write_loop())
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """Inicia el servidor y lo mantiene hasta que se cancele"""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Deja de aceptar conexiones y termina las escrituras en cola"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._writer_task is not None:
+            await self._writes.join()
+            self._writer_task.cancel()
+        self._read_pool.shutdown(wait=True)
+        self._write_pool.shutdown(wait=True)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atiende los pedidos de una conexión (keep-alive) uno tras otro"""
+        if self.connections >= self.max_connections:
+            self.metrics.rejected += 1
+            writer.write(self._encode(*self._overloaded("Demasiadas conexiones"), keep_alive=False))
+            await self._close_writer(writer)
+            return
+
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEPALIVE_TIMEOUT_S)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ApiError as e:
+                    response = self._json(e.status, {'error': e.message})
+                    writer.write(self._encode(*response, keep_alive=False))
+                    break
+                if request is None:
+                    break
+
+                method, target, headers, body, keep_alive = request
+                started = time.perf_counter()
+                status, response_headers, response_body = await self._respond(method, target, headers, body)
+                elapsed = time.perf_counter() - started
+
+                self.metrics.record(metrics_route(method, urlsplit(target).path), elapsed, status)
+                response_headers.append(('Server-Timing', f"app;dur={elapsed * 1000:.2f}"))
+                writer.write(self._encode(status, response_headers, response_body, keep_alive))
+                # Un cliente lento frena su propia conexión, no al servidor
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            await self._close_writer(writer)
+
+    async def _close_writer(self, writer: asyncio.StreamWriter):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """
+        Lee un pedido HTTP/1.1
+
+        Returns:
+            Tupla (método, destino, encabezados, cuerpo, keep-alive) o None
+            si el cliente cerró la conexión
+        """
+        try:
+            line = await reader.readline()
+            if not line:
+                return None
+            method, target, version = line.decode('latin-1').split()
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                if len(headers) >= MAX_HEADERS:
+                    raise ApiError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Demasiados encabezados")
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length') or 0)
+        except (ValueError, asyncio.LimitOverrunError):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Pedido HTTP inválido") from None
+
+        if length < 0:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Pedido HTTP inválido")
+        # El cuerpo solo se lee por Content-Length (sin chunks): se responde
+        # y se cierra la conexión, como con cualquier pedido inválido
+        if 'transfer-encoding' in headers:
+            raise ApiError(HTTPStatus.LENGTH_REQUIRED, "Transfer-Encoding no soportado: usar Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Pedido demasiado grande")
+        body = await reader.readexactly(length) if length else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        return method.upper(), target, headers, body, keep_alive
+
+    async def _respond(self, method: str, target: str, headers: Dict[str, str],
+                       body: bytes) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """Resuelve un pedido y arma la respuesta"""
+        url = urlsplit(target)
+
+        if method == 'OPTIONS':
+            cors = [
+                ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+                ('Access-Control-Allow-Headers', 'Content-Type, If-None-Match'),
+                ('Content-Length', '0')
+            ]
+            if self.allow_origin:
+                cors.insert(0, ('Access-Control-Allow-Origin', self.allow_origin))
+            return HTTPStatus.NO_CONTENT, cors, b''
+
+        if method == 'GET' and url.path == '/api/metrics':
+            return self._json(HTTPStatus.OK, self.metrics_snapshot())
+
+        if method == 'GET' and not url.path.startswith('/api/') and self.static_dir:
+            static = await asyncio.get_running_loop().run_in_executor(
+                self._read_pool, read_static, self.static_dir, url.path
+            )
+            if static is None:
+                return self._json(HTTPStatus.NOT_FOUND, {'error': "Archivo inexistente"})
+            return build_response(HTTPStatus.OK, *static, True, headers.get('accept-encoding'),
+                                  headers.get('if-none-match'), self.allow_origin)
+
+        try:
+            query = parse_qs(url.query)
+            payload = decode_json(body, headers.get('content-encoding')) if method == 'POST' else None
+            if self.api.is_write(method, url.path):
+                status, result = await self._write(method, url.path, query, payload)
+            else:
+                status, result = await self._read(method, url.path, query, payload)
+        except ApiError as e:
+            if e.status == HTTPStatus.SERVICE_UNAVAILABLE:
+                return self._overloaded(e.message)
+            status, result = e.status, {'error': e.message}
+        except Exception as e:
+            print(f"Error atendiendo {method} {target}: {e!r}", file=sys.stderr)
+            status, result = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"Error: {str(e)}"}
+
+        return build_response(status, encode_json(result), JSON_CONTENT_TYPE, method == 'GET',
+                              headers.get('accept-encoding'), headers.get('if-none-match'),
+                              self.allow_origin)
+
+    async def _read(self, method: str, path: str, query: Dict, body: Any = None) -> Tuple[int, Any]:
+        """Ejecuta una lectura en el grupo de hilos de lectura"""
+        if self.pending_reads >= self.max_pending_reads:
+            self.metrics.rejected += 1
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "Servidor ocupado")
+
+        self.pending_reads += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._read_pool, self.api.handle, method, path, query, body
+            )
+        finally:
+            self.pending_reads -= 1
+
+    async def _write(self, method: str, path: str, query: Dict, body: Any) -> Tuple[int, Any]:
+        """Encola una escritura y espera su resultado"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._writes.put_nowait((future, method, path, query, body))
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "Demasiadas escrituras en cola") from None
+        return await future
+
+    async def _write_loop(self):
+        """Único consumidor de la cola de escrituras"""
+        loop = asyncio.get_running_loop()
+        while True:
+            group = [await self._writes.get()]
+            while len(group) < WRITE_GROUP_MAX and not self._writes.empty():
+                group.append(self._writes.get_nowait())
+
+            try:
+                outcomes = await loop.run_in_executor(self._write_pool, self._apply_writes, group)
+            except Exception as e:
+                outcomes = [e] * len(group)
+            self.writes += len(group)
+            self.write_commits += 1
+
+            for (future, *_request), outcome in zip(group, outcomes):
+                if future.cancelled():
+                    pass
+                elif isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+                self._writes.task_done()
+
+    def _apply_writes(self, group: List[tuple]) -> List[Any]:
+        """
+        Aplica un grupo de escrituras en una transacción (en el hilo
+        escritor). Cada pedido es un savepoint: si falla, solo se deshace
+        su parte.
+        """
+        outcomes = []
+        with self.api.db.transaction():
+            for _future, method, path, query, body in group:
+                try:
+                    with self.api.db.transaction():
+                        outcomes.append(self.api.handle(method, path, query, body))
+                except Exception as e:
+                    outcomes.append(e)
+        return outcomes
+
+    def metrics_snapshot(self) -> Dict:
+        """Latencias por ruta más el estado actual de las colas"""
+        snapshot = self.metrics.snapshot()
+        snapshot.update({
+            'connections': self.connections,
+            'pending_reads': self.pending_reads,
+            'queued_writes': self._writes.qsize() if self._writes is not None else 0,
+            'writes': self.writes,
+            'write_commits': self.write_commits
+        })
+        return snapshot
+
+    def _json(self, status: int, payload: Any) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        return build_response(status, encode_json(payload), JSON_CONTENT_TYPE, False,
+                              allow_origin=self.allow_origin)
+
+    def _overloaded(self, message: str) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        status, headers, body = self._json(HTTPStatus.SERVICE_UNAVAILABLE, {'error': message})
+        headers.append(('Retry-After', str(RETRY_AFTER_S)))
+        return status, headers, body
+
+    def _encode(self, status: int, headers: List[Tuple[str, str]], body: bytes,
+                keep_alive: bool = True) -> bytes:
+        """Respuesta completa (encabezados y cuerpo) en un solo bloque"""
+        lines = [f"HTTP/1.1 {int(status)} {HTTPStatus(status).phrase}", "Server: OakyDesktop"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        if not keep_alive:
+            lines.append("Connection: close")
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Punto de entrada: python server.py [--async] [--port N] [--static CARPETA]"""
+    parser = argparse.ArgumentParser(description="API HTTP local de Oaky Desktop")
+    parser.add_argument('--db', default='oaky.db', help="Archivo de base de datos (por defecto oaky.db)")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS)
+    parser.add_argument('--static', help="Carpeta de la interfaz web (index.html) a servir en /")
+    parser.add_argument('--allow-origin', help="Origen permitido por CORS, si la web se sirve aparte")
+    parser.add_argument('--verbose', action='store_true', help="Registrar cada pedido")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Modo asyncio para muchas terminales a la vez")
+    parser.add_argument('--read-workers', type=int, default=ASYNC_READ_WORKERS,
+                        help="Conexiones de lectura en modo asyncio")
+    parser.add_argument('--max-pending-reads', type=int, default=ASYNC_MAX_PENDING_READS)
+    parser.add_argument('--write-queue', type=int, default=ASYNC_WRITE_QUEUE_SIZE)
+    parser.add_argument('--max-connections', type=int, default=ASYNC_MAX_CONNECTIONS)
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    if args.use_async:
+        return run_async(db, args)
+
+    server = ApiServer((args.host, args.port), db, args.threads, args.static,
+                       args.allow_origin, args.verbose)
+    print(f"Oaky Desktop API en http://{args.host}:{server.server_port}/api/", file=sys.stderr)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.close()
+    return 0
+
+
+def run_async(db: Database, args) -> int:
+    """Ejecuta AsyncApiServer hasta Ctrl+C"""
+    server = AsyncApiServer(db, args.host, args.port, args.read_workers, args.max_pending_reads,
+                            args.write_queue, args.max_connections, args.static, args.allow_origin)
+
+    async def serve():
+        await server.start()
+        print(f"Oaky Desktop API (asyncio) en http://{args.host}:{server.port}/api/", file=sys.stderr)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
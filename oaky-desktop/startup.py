@@ -0,0 +1,49 @@
+"""
+Medición del arranque de Oaky Desktop
+Registra cuánto tarda cada etapa hasta que se dibuja la primera ventana
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class StartupTimer:
+    """
+    Cronómetro de etapas del arranque.
+
+    Cada mark guarda el tiempo transcurrido desde started_at (idealmente
+    tomado antes de importar tkinter), así el informe muestra tanto el
+    acumulado como lo que tardó cada etapa.
+    """
+
+    def __init__(self, started_at: Optional[float] = None):
+        """
+        Args:
+            started_at: time.perf_counter() del inicio (por defecto, ahora)
+        """
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str):
+        """Registra el fin de una etapa"""
+        self.marks.append((stage, time.perf_counter() - self.started_at))
+
+    def report(self) -> Dict[str, float]:
+        """
+        Tiempos acumulados
+
+        Returns:
+            Diccionario etapa -> milisegundos desde el inicio
+        """
+        return {stage: elapsed * 1000 for stage, elapsed in self.marks}
+
+    def format(self) -> str:
+        """Informe legible, una etapa por línea"""
+        lines = ["Arranque:"]
+        previous = 0.0
+        for stage, elapsed in self.marks:
+            lines.append(
+                f"  {stage:<20} {elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:.1f})"
+            )
+            previous = elapsed
+        return '\n'.join(lines)
@@ -0,0 +1,253 @@
+"""
+Tareas en segundo plano para Oaky Desktop
+Ejecuta consultas fuera del hilo principal de Tkinter
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+from database import Database
+
+
+class SearchScheduler:
+    """
+    Programa búsquedas con debounce y las ejecuta en un hilo de trabajo.
+
+    Cada pulsación reinicia el temporizador (root.after); solo cuando el
+    usuario deja de escribir se envía la consulta al hilo, que usa su propia
+    conexión SQLite. Los resultados que llegan tarde (de una búsqueda ya
+    reemplazada por otra) se descartan y solo el último se entrega a la UI.
+    """
+
+    POLL_MS = 20
+
+    def __init__(self, root, db_path: str, on_results: Callable[[Any], None],
+                 delay_ms: int = 250, on_error: Optional[Callable[[Exception], None]] = None,
+                 query: Optional[Callable[[Database, str], Any]] = None):
+        """
+        Args:
+            root: Ventana raíz de Tkinter
+            db_path: Ruta a la base de datos (el hilo abre su propia conexión)
+            on_results: Callback que recibe el resultado de la consulta
+            delay_ms: Tiempo de espera desde la última pulsación
+            on_error: Callback opcional ante errores de la consulta
+            query: Función (db, término) ejecutada en el hilo de trabajo
+                (por defecto Database.search_products). No debe tocar Tk.
+        """
+        self.root = root
+        self.db_path = db_path
+        self.on_results = on_results
+        self.query = query or (lambda db, search_term: db.search_products(search_term))
+        self.on_error = on_error
+        self.delay_ms = delay_ms
+
+        self._generation = 0
+        self._submitted = None
+        self._after_id = None
+        self._poll_id = None
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def schedule(self, search_term: str):
+        """Programa una búsqueda, cancelando la pendiente si la hay"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+
+        # Cualquier resultado en vuelo pasa a ser obsoleto
+        self._generation += 1
+        self._after_id = self.root.after(
+            self.delay_ms, self._submit, self._generation, search_term
+        )
+
+    def cancel(self):
+        """Descarta la búsqueda pendiente y el resultado en vuelo, si los hay"""
+        for after_id in (self._after_id, self._poll_id):
+            if after_id is not None:
+                self.root.after_cancel(after_id)
+        self._after_id = None
+        self._poll_id = None
+
+        # El hilo descarta el pedido en vuelo sin responder: no esperarlo
+        self._submitted = None
+        self._generation += 1
+
+    def stop(self):
+        """Detiene el hilo de trabajo y cancela los temporizadores"""
+        for after_id in (self._after_id, self._poll_id):
+            if after_id is not None:
+                self.root.after_cancel(after_id)
+        self._after_id = None
+        self._poll_id = None
+        self._requests.put(None)
+
+    def _submit(self, generation: int, search_term: str):
+        """Envía la búsqueda al hilo de trabajo"""
+        self._after_id = None
+        self._submitted = generation
+        self._requests.put((generation, search_term))
+
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.POLL_MS, self._poll)
+
+    def _worker(self):
+        """Bucle del hilo: ejecuta solo la búsqueda más reciente"""
+        db = None
+
+        while True:
+            request = self._requests.get()
+
+            # Si se acumularon pedidos, quedarse con el último
+            while request is not None:
+                try:
+                    request = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+
+            if request is None:
+                break
+
+            generation, search_term = request
+            if generation != self._generation:
+                continue
+
+            try:
+                if db is None:
+                    db = Database(self.db_path)
+                result = self.query(db, search_term)
+                self._results.put((generation, result, None))
+            except Exception as e:
+                self._results.put((generation, None, e))
+
+        if db is not None:
+            db.close()
+
+    def _poll(self):
+        """Revisa (en el hilo de Tk) si llegó el resultado vigente"""
+        self._poll_id = None
+        latest = None
+
+        while True:
+            try:
+                latest = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+        if latest is not None and latest[0] == self._submitted:
+            self._submitted = None
+            generation, result, error = latest
+
+            if generation == self._generation:
+                if error is None:
+                    self.on_results(result)
+                elif self.on_error:
+                    self.on_error(error)
+
+        if self._submitted is not None:
+            self._poll_id = self.root.after(self.POLL_MS, self._poll)
+
+
+class BackgroundTask:
+    """
+    Ejecuta una tarea larga (importar, exportar) en un hilo de trabajo.
+
+    La tarea recibe su propia conexión a la base de datos, una función para
+    informar el avance y otra para consultar si se pidió cancelar. El hilo de
+    Tk revisa periódicamente la cola de mensajes y llama a los callbacks, de
+    modo que la interfaz nunca se congela.
+    """
+
+    POLL_MS = 100
+
+    def __init__(self, root, db_path: str,
+                 task: Callable[[Database, Callable[[Any], None], Callable[[], bool]], Any],
+                 on_progress: Optional[Callable[[Any], None]] = None,
+                 on_done: Optional[Callable[[Any], None]] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None):
+        """
+        Args:
+            root: Ventana raíz de Tkinter
+            db_path: Ruta a la base de datos (el hilo abre su propia conexión)
+            task: Función (db, progress, cancelled) ejecutada en el hilo
+            on_progress: Callback con cada aviso de avance (solo el último
+                de cada intervalo de revisión)
+            on_done: Callback con el resultado de la tarea
+            on_error: Callback si la tarea lanza una excepción
+        """
+        self.root = root
+        self.db_path = db_path
+        self.task = task
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self._cancel = threading.Event()
+        self._messages = queue.Queue()
+        self._thread = None
+        self._poll_id = None
+
+    @property
+    def running(self) -> bool:
+        """Indica si la tarea sigue en ejecución"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Lanza la tarea en un hilo nuevo"""
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._poll_id = self.root.after(self.POLL_MS, self._poll)
+
+    def cancel(self):
+        """Pide a la tarea que se detenga en el próximo punto seguro"""
+        self._cancel.set()
+
+    def _run(self):
+        """Cuerpo del hilo de trabajo"""
+        db = None
+        try:
+            db = Database(self.db_path)
+            result = self.task(
+                db,
+                lambda info: self._messages.put(('progress', info)),
+                self._cancel.is_set
+            )
+            self._messages.put(('done', result))
+        except Exception as e:
+            self._messages.put(('error', e))
+        finally:
+            if db is not None:
+                db.close()
+
+    def _poll(self):
+        """Entrega a la UI (en el hilo de Tk) los mensajes del hilo"""
+        self._poll_id = None
+        progress = None
+        finished = None
+
+        while True:
+            try:
+                kind, payload = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                progress = payload
+            else:
+                finished = (kind, payload)
+
+        if progress is not None and self.on_progress:
+            self.on_progress(progress)
+
+        if finished is None:
+            self._poll_id = self.root.after(self.POLL_MS, self._poll)
+            return
+
+        kind, payload = finished
+        if kind == 'done':
+            if self.on_done:
+                self.on_done(payload)
+        elif self.on_error:
+            self.on_error(payload)